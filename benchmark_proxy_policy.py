@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+TorCOIN Proxy Policy Micro-Benchmark
+Measures the per-request allow-list and header filtering cost of
+torcoin_proxy.ProxyPolicy against the inline checks it replaced.
+"""
+
+import argparse
+import email.message
+import time
+from urllib.parse import urlparse, urljoin
+
+import torcoin_proxy
+from torcoin_proxy import ALLOWED_HOST, ALLOWED_PORT, ALLOWED_URL, POLICY
+
+# A typical browser request going through the proxy
+SAMPLE_PATH = f"http://{ALLOWED_HOST}:{ALLOWED_PORT}/torcoin.html?ref=wallet"
+SAMPLE_HEADERS = [
+    ("Host", f"{ALLOWED_HOST}:{ALLOWED_PORT}"),
+    ("User-Agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"),
+    ("Accept", "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+    ("Accept-Language", "en-US,en;q=0.9"),
+    ("Accept-Encoding", "gzip, deflate, br"),
+    ("Connection", "keep-alive"),
+    ("Proxy-Connection", "keep-alive"),
+    ("Upgrade-Insecure-Requests", "1"),
+    ("Cache-Control", "max-age=0"),
+]
+SAMPLE_RESPONSE_HEADERS = [
+    ("Server", "SimpleHTTP/0.6 Python/3.11"),
+    ("Date", "Sat, 22 Nov 2025 01:44:36 GMT"),
+    ("Keep-Alive", "timeout=15, max=99"),
+    ("Content-type", "text/html; charset=utf-8"),
+    ("Content-length", "7250"),
+    ("ETag", '"0e06a9acf47588c47b620e638b2a2c15-gzip"'),
+    ("Last-Modified", "Sat, 22 Nov 2025 01:44:36 GMT"),
+    ("Cache-Control", "no-cache"),
+    ("Vary", "Accept-Encoding"),
+    ("Content-Encoding", "gzip"),
+]
+
+def legacy_request(path, headers):
+    """The filtering TorCOINProxyHandler.do_GET did before ProxyPolicy."""
+    parsed_url = urlparse(path)
+    if parsed_url.netloc != f"{ALLOWED_HOST}:{ALLOWED_PORT}" and \
+       not path.startswith(f"http://{ALLOWED_HOST}:{ALLOWED_PORT}"):
+        return None
+
+    if path.startswith("http"):
+        target_url = path
+    else:
+        target_url = urljoin(ALLOWED_URL, path)
+
+    target_parsed = urlparse(target_url)
+    if target_parsed.hostname != ALLOWED_HOST or target_parsed.port != ALLOWED_PORT:
+        return None
+
+    forwarded = {'User-Agent': 'TorCOIN-Proxy/1.0'}
+    for header, value in headers.items():
+        if header.lower() not in ['host', 'connection', 'keep-alive', 'proxy-authenticate',
+                                'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
+                                'upgrade']:
+            forwarded[header] = value
+
+    # The upstream request path was parsed a third time when sending
+    parsed = urlparse(target_url)
+    upstream_path = parsed.path or "/"
+    if parsed.query:
+        upstream_path += "?" + parsed.query
+    return target_url, upstream_path, forwarded
+
+def legacy_response(response_headers):
+    """The inline response filter, minus content-encoding: bodies are relayed as sent."""
+    return [(header, value) for header, value in response_headers
+            if header.lower() not in ['connection', 'keep-alive', 'proxy-authenticate',
+                                    'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
+                                    'upgrade']]
+
+def policy_request(path, headers):
+    """The same work through the precompiled ProxyPolicy."""
+    target = POLICY.resolve(path)
+    if target is None:
+        return None
+    forwarded = {'User-Agent': 'TorCOIN-Proxy/1.0'}
+    forwarded.update(POLICY.request_headers(headers.items()))
+    return target[0], target[1], forwarded
+
+def policy_response(response_headers):
+    return POLICY.response_headers(response_headers)
+
+def run(request_func, response_func, headers, iterations):
+    """Return requests/sec for iterations of request + response filtering."""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        request_func(SAMPLE_PATH, headers)
+        response_func(SAMPLE_RESPONSE_HEADERS)
+    return iterations / (time.perf_counter() - start)
+
+def main():
+    """Run both implementations and print the comparison."""
+    parser = argparse.ArgumentParser(description="TorCOIN proxy policy micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=200000,
+                        help="requests to simulate per run (default: 200000)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per implementation; the best is reported (default: 3)")
+    args = parser.parse_args()
+
+    # Same header object type the handler sees
+    headers = email.message.Message()
+    for name, value in SAMPLE_HEADERS:
+        headers[name] = value
+
+    # Both implementations must agree before timing them
+    legacy = legacy_request(SAMPLE_PATH, headers)
+    current = policy_request(SAMPLE_PATH, headers)
+    assert legacy[:2] == current[:2] and legacy[2] == current[2], (legacy, current)
+    legacy = legacy_response(SAMPLE_RESPONSE_HEADERS)
+    current = policy_response(SAMPLE_RESPONSE_HEADERS)
+    assert legacy == current, (legacy, current)
+
+    print("=" * 60)
+    print("      TORCOIN PROXY POLICY MICRO-BENCHMARK")
+    print("=" * 60)
+    print(f"Proxy module: {torcoin_proxy.__file__}")
+    print(f"Iterations: {args.iterations} x {args.repeat}")
+    print()
+
+    legacy_rate = max(run(legacy_request, legacy_response, headers, args.iterations)
+                      for _ in range(args.repeat))
+    policy_rate = max(run(policy_request, policy_response, headers, args.iterations)
+                      for _ in range(args.repeat))
+
+    print(f"Legacy inline checks: {legacy_rate:12,.0f} requests/sec")
+    print(f"ProxyPolicy:          {policy_rate:12,.0f} requests/sec")
+    print(f"Speedup:              {policy_rate / legacy_rate:12.2f}x")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    main()
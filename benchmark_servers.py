@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+TorCOIN Load-Testing Benchmark
+Starts coin_server.py and torcoin_proxy.py locally, drives them with
+concurrent clients and reports throughput, p50/p99 latency and server
+memory. Results can be saved as JSON and compared against an older run.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import psutil  # Optional: pip install psutil (memory on non-Linux systems)
+except ImportError:
+    psutil = None
+
+from coin_server import HTML_FILE, PORT as SERVER_PORT
+from torcoin_proxy import ALLOWED_URL
+
+# Defaults
+HOST = "127.0.0.1"
+PROXY_PORT = 18080  # Keeps clear of a proxy already running on 8080
+CONCURRENCY = 16
+REQUESTS = 2000  # Measured requests per scenario
+WARMUP = 50  # Unmeasured requests before each scenario
+STARTUP_TIMEOUT = 10  # Seconds to wait for a spawned server to accept connections
+REQUEST_TIMEOUT = 30
+
+# name -> (method, keep_alive, share of requests for the shared URL)
+# The rest go to unique URLs, which always miss the proxy cache. coin_server
+# only answers GET/HEAD, so there is no POST scenario.
+SCENARIOS = {
+    "get-keepalive": ("GET", True, 1.0),
+    "get-close": ("GET", False, 1.0),
+    "get-cache-mix": ("GET", True, 0.5),
+    "get-cache-miss": ("GET", True, 0.0),
+}
+HIT_PATH = "/"
+# The server redirects "/?query" to "/", but serves the page file itself with
+# any query string, so a unique query gives a real 200 miss through the proxy
+MISS_PATH = f"/{HTML_FILE}"
+TARGETS = ("server", "proxy")
+
+def process_memory(pid):
+    """Return (rss_kb, peak_rss_kb) for a process and its children (prefork workers).
+
+    Returns (None, None) if unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        rss, peak = int(fields["VmRSS"].split()[0]), int(fields["VmHWM"].split()[0])
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+        for child in children:
+            child_rss, child_peak = process_memory(child)
+            rss += child_rss or 0
+            peak += child_peak or 0
+        return rss, peak
+    except (OSError, KeyError, ValueError):
+        pass
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            rss = peak = 0
+            for member in [process] + process.children(recursive=True):
+                info = member.memory_info()
+                rss += info.rss // 1024
+                peak += getattr(info, "peak_wset", info.rss) // 1024  # Peak is Windows only
+            return rss, peak
+        except psutil.Error:
+            pass
+    return None, None
+
+def port_in_use(port):
+    """Whether something already accepts connections on port."""
+    try:
+        socket.create_connection((HOST, port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+def check_running(process):
+    """Raise if a spawned server has exited."""
+    if process.poll() is not None:
+        raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+
+def wait_for_port(port, process, timeout=STARTUP_TIMEOUT):
+    """Block until process accepts connections on port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        check_running(process)
+        if port_in_use(port):
+            # A child that failed to bind may only just be exiting
+            time.sleep(0.2)
+            check_running(process)
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for port {port}")
+
+def spawn(args, port):
+    """Start one of the bundled scripts quietly and wait until it is listening."""
+    # Otherwise a stale server on the port would be benchmarked in place of the new one
+    if port_in_use(port):
+        raise RuntimeError(f"Port {port} is already in use; stop whatever is listening there "
+                           f"or pass --no-spawn to benchmark it as is")
+    here = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.Popen([sys.executable] + args, cwd=here,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+    except BaseException:
+        process.kill()
+        raise
+    return process
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class LoadClient:
+    """One simulated client: a thread sending requests back to back."""
+
+    def __init__(self, target_port, via_proxy, method, keep_alive, hit_share, run_id, client_id):
+        self.target_port = target_port
+        self.via_proxy = via_proxy
+        self.method = method
+        self.keep_alive = keep_alive
+        self.hit_share = hit_share
+        self.run_id = run_id
+        self.client_id = client_id
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self._conn = None
+        self._sent = 0
+
+    def next_path(self):
+        # Spread cache misses evenly instead of bunching them at the start
+        self._sent += 1
+        hits_due = int(self._sent * self.hit_share) - int((self._sent - 1) * self.hit_share)
+        if hits_due:
+            path = HIT_PATH
+        else:
+            path = f"{MISS_PATH}?bench={self.run_id}-{self.client_id}-{self._sent}"
+        return ALLOWED_URL + path if self.via_proxy else path
+
+    def request(self, measure=True):
+        path = self.next_path()
+        headers = {"Accept-Encoding": "gzip, deflate, br", "User-Agent": "TorCOIN-Benchmark/1.0"}
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+
+        started = time.perf_counter()
+        try:
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(HOST, self.target_port,
+                                                        timeout=REQUEST_TIMEOUT)
+            self._conn.request(self.method, path, headers=headers)
+            response = self._conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            if measure:
+                self.errors += 1
+            return
+        elapsed = time.perf_counter() - started
+
+        if not self.keep_alive or response.will_close:
+            self.close()
+        if measure:
+            self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+            # A redirect or error page is fast and cheap; timing it would flatter the run
+            if 200 <= response.status < 300:
+                self.latencies.append(elapsed)
+            else:
+                self.errors += 1
+
+    def run(self, count, warmup, start_barrier):
+        for _ in range(warmup):
+            self.request(measure=False)
+        start_barrier.wait()
+        for _ in range(count):
+            self.request()
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+def run_scenario(target, name, target_port, concurrency, requests, warmup, pids):
+    """Run one scenario and return its result record."""
+    method, keep_alive, hit_share = SCENARIOS[name]
+    run_id = uuid.uuid4().hex[:8]
+    clients = [LoadClient(target_port, target == "proxy", method, keep_alive, hit_share,
+                          run_id, index) for index in range(concurrency)]
+
+    # Warm up, then release every client at once
+    start_barrier = threading.Barrier(concurrency + 1)
+    threads = []
+    for index, client in enumerate(clients):
+        count = requests // concurrency + (1 if index < requests % concurrency else 0)
+        warm = warmup // concurrency + (1 if index < warmup % concurrency else 0)
+        threads.append(threading.Thread(target=client.run, args=(count, warm, start_barrier),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+
+    memory = {}
+    for role, pid in pids.items():
+        rss, peak = process_memory(pid)
+        memory[role] = {"rss_kb": rss, "peak_rss_kb": peak}
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        "target": target,
+        "scenario": name,
+        "method": method,
+        "keep_alive": keep_alive,
+        "cache_hit_share": hit_share,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(client.errors for client in clients),  # Failed requests and non-2xx
+        "statuses": statuses,
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "memory": memory,
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_result(result):
+    memory = ", ".join(f"{role} {values['rss_kb']} KB" for role, values in result["memory"].items()
+                       if values["rss_kb"] is not None) or "n/a"
+    print(f"{result['target']:<7} {result['scenario']:<15} {result['requests_per_sec'] or 0:>10,.1f} req/s"
+          f"  p50 {result['p50_ms'] or 0:>8.2f} ms  p99 {result['p99_ms'] or 0:>8.2f} ms"
+          f"  errors {result['errors']:<4} RSS {memory}")
+    statuses = ", ".join(f"{status}: {count}" for status, count in sorted(result["statuses"].items()))
+    print(f"{'':<23} statuses {statuses or 'none'}")
+
+def print_comparison(results, baseline_path):
+    """Print throughput and p99 changes against an earlier JSON report."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["target"], r["scenario"]): r for r in baseline["results"]}
+    print()
+    print(f"Compared with {baseline_path} ({baseline.get('revision') or 'unknown revision'}):")
+    for result in results:
+        old = previous.get((result["target"], result["scenario"]))
+        if old is None or not old.get("requests_per_sec") or not old.get("p99_ms"):
+            continue
+        throughput = (result["requests_per_sec"] / old["requests_per_sec"] - 1) * 100
+        p99 = (result["p99_ms"] / old["p99_ms"] - 1) * 100
+        print(f"{result['target']:<7} {result['scenario']:<15} throughput {throughput:+7.1f}%"
+              f"   p99 {p99:+7.1f}%")
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="TorCOIN server/proxy load-testing benchmark")
+    parser.add_argument("--target", choices=TARGETS + ("both",), default="both",
+                        help="what to drive: the web server directly, the proxy, or both")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default: all)")
+    parser.add_argument("--server-mode", default="threaded",
+                        help="coin_server.py --mode for the spawned server (default: threaded)")
+    parser.add_argument("--server-workers", type=int, default=0,
+                        help="run the spawned server in prefork mode with this many workers")
+    parser.add_argument("--proxy-engine", default="threaded",
+                        help="torcoin_proxy.py --engine for the spawned proxy (default: threaded)")
+    parser.add_argument("--proxy-port", type=int, default=PROXY_PORT,
+                        help=f"port for the spawned proxy (default: {PROXY_PORT})")
+    parser.add_argument("--no-spawn", action="store_true",
+                        help="benchmark servers that are already running")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY,
+                        help=f"simultaneous clients (default: {CONCURRENCY})")
+    parser.add_argument("--requests", type=int, default=REQUESTS,
+                        help=f"measured requests per scenario (default: {REQUESTS})")
+    parser.add_argument("--warmup", type=int, default=WARMUP,
+                        help=f"unmeasured requests before each scenario (default: {WARMUP})")
+    parser.add_argument("--json", metavar="PATH",
+                        help="write the results as JSON to PATH")
+    parser.add_argument("--compare", metavar="PATH",
+                        help="compare against an earlier --json report")
+    return parser.parse_args(argv)
+
+def main():
+    """Start the servers, run every scenario and report."""
+    args = parse_args()
+    targets = TARGETS if args.target == "both" else (args.target,)
+    scenarios = args.scenario or list(SCENARIOS)
+
+    print("=" * 60)
+    print("      TORCOIN LOAD-TESTING BENCHMARK")
+    print("=" * 60)
+    print(f"Server mode: {args.server_mode}   Proxy engine: {args.proxy_engine}")
+    if args.server_workers:
+        print(f"Server prefork workers: {args.server_workers}")
+    print(f"Concurrency: {args.concurrency}   Requests per scenario: {args.requests}")
+    print()
+
+    processes = {}
+    try:
+        if not args.no_spawn:
+            # Access lines are sampled out so the servers aren't benchmarking their logging
+            quiet = ["--log-sample", "0", "--metrics-port", "0"]
+            server_args = ["coin_server.py", "--mode", args.server_mode] + quiet
+            if args.server_workers:
+                server_args += ["--prefork", "--workers", str(args.server_workers)]
+            processes["server"] = spawn(server_args, SERVER_PORT)
+            if "proxy" in targets:
+                # All load comes from one IP, so the per-client limits are lifted
+                unlimited = ["--rate", "0", "--max-connections-per-ip", "0"]
+                processes["proxy"] = spawn(["torcoin_proxy.py", "--engine", args.proxy_engine,
+                                            "--port", str(args.proxy_port)] + quiet + unlimited,
+                                           args.proxy_port)
+
+        results = []
+        for target in targets:
+            port = SERVER_PORT if target == "server" else args.proxy_port
+            pids = {role: process.pid for role, process in processes.items()
+                    if target == "proxy" or role == "server"}
+            for name in scenarios:
+                result = run_scenario(target, name, port, args.concurrency, args.requests,
+                                      args.warmup, pids)
+                print_result(result)
+                results.append(result)
+                for process in processes.values():
+                    check_running(process)
+    finally:
+        for process in processes.values():
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    print("=" * 60)
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "server_mode": args.server_mode,
+            "server_workers": args.server_workers,
+            "proxy_engine": args.proxy_engine,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+if __name__ == "__main__":
+    main()
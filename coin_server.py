@@ -4,79 +4,1107 @@ TorCOIN Web Server
 Serves the 3D animated coin HTML page at the specified IP address.
 """
 
+import argparse
+import asyncio
+import email.utils
+import functools
+import gzip
+import hashlib
 import http.server
+import io
+import mimetypes
+import multiprocessing
+import signal
+import socket
 import socketserver
 import os
+import selectors
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote
 
+from torcoin_lifecycle import (DRAIN_TIMEOUT, HANDOFF_SUPPORTED, HANDOFF_TIMEOUT,
+                               DrainingHandlerMixin, DrainingServerMixin, Lifecycle,
+                               add_lifecycle_arguments, drain_connections, inherited_socket,
+                               notify_ready)
+from torcoin_logging import AccessLog, add_logging_arguments, configure_from_args
+from torcoin_metrics import (METRICS_HOST, HTTPMetrics, MetricsRegistry, add_metrics_arguments,
+                             hit_ratio, start_metrics_server,
+                             start_metrics_server_after_handoff)
+from torcoin_minify import minify_html
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
 # Configuration
 HOST_IP = "0.0.0.0"  # Bind to all available interfaces
 PORT = 50129  # Custom port
 DISPLAY_URL = "https://www.torcoin.cnet"  # Ultra hardcoded display URL
 HTML_FILE = "torcoin_website.html"
+CACHE_CHECK_INTERVAL = 1.0  # Seconds between file change checks for cached pages
+
+# Concurrency defaults
+SERVER_MODES = ("single", "threaded", "asyncio")
+DEFAULT_MODE = "threaded"
+MAX_THREADS = 32  # Worker threads in the thread-pool backend
+MAX_CONNECTIONS = 256  # Concurrent connections before new ones wait in the backlog
+BACKLOG = 128  # Listen queue size
+REQUEST_TIMEOUT = 30  # Seconds to wait for a client to send its request
+METRICS_PORT = 50130  # Local-only port for the /metrics endpoint
+
+# Prefork (multi-process) mode
+SUPERVISOR_INTERVAL = 1.0  # Seconds between worker/HTML checks in the supervisor
+WORKER_STARTUP_TIMEOUT = 60  # Seconds a new worker gets to warm its cache and bind
+WORKER_EXIT_GRACE = 10  # Seconds past --drain-timeout before a stopping worker is killed
+MAX_RESTART_DELAY = 30  # Upper bound for the crash-loop restart backoff
+
+# HTTP/1.1 persistent connections
+KEEPALIVE_TIMEOUT = 15  # Seconds an idle keep-alive connection is kept open
+MAX_KEEPALIVE_REQUESTS = 100  # Requests served on one connection before closing it
+
+# Static files (sent with zero-copy sendfile, Range supported)
+STATIC_DIR = "."  # Directory the static files are served from
+STATIC_EXTENSIONS = (".html", ".zip")  # Only these file types are ever served
+
+# Compression
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+ENCODING_PREFERENCE = ("br", "gzip")  # Tried in this order when the client accepts both
+
+def compress_variants(body):
+    """Build the compressed variants of body that are worth sending."""
+    variants = {}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the gzip output identical across reloads of the same file
+    variants["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return {name: data for name, data in variants.items() if len(data) < len(body)}
+
+@functools.lru_cache(maxsize=256)
+def choose_encoding(accept_encoding, available):
+    """Pick a content-coding from the Accept-Encoding header, or 'identity'."""
+    if not accept_encoding:
+        return "identity"
+
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            qvalues[coding] = q
+
+    wildcard = qvalues.get("*")
+    best, best_q = "identity", 0.0
+    for coding in ENCODING_PREFERENCE:
+        if coding not in available:
+            continue
+        q = qvalues.get(coding, wildcard if wildcard is not None else 0.0)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def parse_http_date(value):
+    """Parse an HTTP date into a timestamp, or None if it is invalid."""
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    return parsed.timestamp() if parsed is not None else None
+
+def is_not_modified(etag, mtime, if_none_match, if_modified_since):
+    """Check conditional request headers against a representation (RFC 7232 rules)."""
+    if if_none_match is not None:
+        # If-None-Match takes precedence; weak comparison is allowed here
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    if if_modified_since:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+def parse_range(range_header, size):
+    """Parse a single-range "bytes=" header.
+
+    Returns (start, end) inclusive, None when the header should be ignored
+    (missing, malformed or multi-range), or "unsatisfiable".
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                return "unsatisfiable"
+            start = max(0, size - length)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    if start < 0 or end < start:
+        return None
+    return start, min(end, size - 1)
+
+def static_file_name(path):
+    """Map a request path to an allowed file in STATIC_DIR, or None."""
+    name = unquote(path.split("?", 1)[0]).lstrip("/")
+    if (not name or "/" in name or "\\" in name or name.startswith(".")
+            or not name.lower().endswith(STATIC_EXTENSIONS)):
+        return None
+    filename = os.path.join(STATIC_DIR, name)
+    return filename if os.path.isfile(filename) else None
+
+class PageVariant:
+    """One encoding of a cached page with its precomputed response headers."""
+
+    def __init__(self, encoding, body, etag, last_modified):
+        self.encoding = encoding
+        self.body = body
+        self.etag = etag
+
+        # Headers shared by 200 and 304 responses
+        self.validator_headers = [
+            ('ETag', etag),
+            ('Last-Modified', last_modified),
+            ('Cache-Control', 'no-cache'),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        self.headers = [
+            ('Content-type', 'text/html; charset=utf-8'),
+            ('Content-length', str(len(body))),
+        ] + self.validator_headers
+        if encoding != "identity":
+            self.headers.append(('Content-Encoding', encoding))
+
+class CachedPage:
+    """A page held in memory, already encoded and ready to send.
+
+    Compressed variants, ETags and Last-Modified are built once when the
+    page is loaded, so serving a request never compresses or hashes anything.
+    """
+
+    def __init__(self, body, mtime, size):
+        self.body = body
+        self.mtime = mtime
+        self.size = size  # Of the file on disk, which may be larger than body when minified
+        self.last_modified = email.utils.formatdate(mtime, usegmt=True)
+
+        # Strong validator: content hash, with a suffix per content-coding
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        bodies = {"identity": body}
+        bodies.update(compress_variants(body))
+        self.variants = {}
+        for encoding, data in bodies.items():
+            etag = f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            self.variants[encoding] = PageVariant(encoding, data, etag, self.last_modified)
+        self.encodings = tuple(name for name in self.variants if name != "identity")
+
+    def select(self, accept_encoding):
+        """Return the PageVariant for the best encoding the client accepts."""
+        return self.variants[choose_encoding(accept_encoding or "", self.encodings)]
+
+    def is_not_modified(self, variant, if_none_match, if_modified_since):
+        """Check the request validators against variant."""
+        return is_not_modified(variant.etag, self.mtime, if_none_match, if_modified_since)
+
+class PageCache:
+    """In-memory page cache that reloads a file only when its mtime/size change.
+
+    HTML files are minified (see torcoin_minify) when loaded, so the
+    compressed variants and ETags are built from the minified page.
+    """
+
+    def __init__(self, check_interval=CACHE_CHECK_INTERVAL, minify=True):
+        self.check_interval = check_interval
+        self.minify = minify
+        self._pages = {}
+        self._next_check = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return the CachedPage for path, or None if the file is missing."""
+        now = time.monotonic()
+        page = self._pages.get(path)
+        if page is not None and now < self._next_check.get(path, 0):
+            PAGE_CACHE_LOOKUPS.inc("hit")
+            return page
+
+        with self._lock:
+            # Another thread may have refreshed the page while we waited
+            page = self._pages.get(path)
+            if page is not None and now < self._next_check.get(path, 0):
+                PAGE_CACHE_LOOKUPS.inc("hit")
+                return page
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._pages.pop(path, None)
+                self._next_check.pop(path, None)
+                return None
+
+            if page is None or page.mtime != st.st_mtime or page.size != st.st_size:
+                PAGE_CACHE_LOOKUPS.inc("miss")
+                with open(path, 'rb') as f:
+                    body = f.read()
+                if self.minify and path.lower().endswith(".html"):
+                    try:
+                        body = minify_html(body.decode("utf-8")).encode("utf-8")
+                    except UnicodeDecodeError:
+                        pass  # Not UTF-8: serve it as written
+                page = CachedPage(body, st.st_mtime, st.st_size)
+                self._pages[path] = page
+            else:
+                PAGE_CACHE_LOOKUPS.inc("hit")
+
+            self._next_check[path] = now + self.check_interval
+            return page
+
+PAGE_CACHE = PageCache()
+ACCESS_LOG = AccessLog("TorCOIN-Server")
 
-class CoinHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+# Exposed on the local metrics port; see torcoin_metrics
+METRICS = MetricsRegistry()
+HTTP_METRICS = HTTPMetrics(METRICS, "torcoin_server")
+PAGE_CACHE_LOOKUPS = METRICS.counter("torcoin_server_page_cache_lookups_total",
+                                     "Page cache lookups, by result (miss = file reloaded)",
+                                     ("result",))
+METRICS.callback("torcoin_server_page_cache_hit_ratio",
+                 "Share of page cache lookups served without reloading the file",
+                 lambda: hit_ratio(PAGE_CACHE_LOOKUPS.value("hit"),
+                                   PAGE_CACHE_LOOKUPS.value("miss")))
+
+class CoinHTTPRequestHandler(DrainingHandlerMixin, http.server.SimpleHTTPRequestHandler):
     """Custom HTTP request handler for serving the coin page."""
 
+    # Persistent connections: pipelined requests are read from the buffered rfile
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    requests_handled = 0
+    # Headers and body are separate writes; without TCP_NODELAY a reused
+    # connection stalls on Nagle + delayed ACK for every response
+    disable_nagle_algorithm = True
+
+    # Static-file mode: send the coin page from disk with sendfile instead of the memory cache
+    serve_page_from_disk = False
+
+    # Port the server listens on (--port), for redirects back to the main page
+    port = PORT
+
+    # Set instead of writing a file body when there is no socket to sendfile() to
+    # (asyncio backend): (filename, offset, count)
+    pending_file = None
+
+    # Per-request bookkeeping for HTTP_METRICS
+    response_status = None
+    body_bytes = 0
+
+    def setup(self):
+        super().setup()
+        HTTP_METRICS.active_connections.inc()
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            HTTP_METRICS.active_connections.dec()
+
+    @classmethod
+    def open_connection(cls, request, client_address, server):
+        """Set up a handler for a connection without reading anything from it.
+
+        ThreadPoolCoinServer then calls handle_available() each time the
+        client has sent something, so waiting for the next request never
+        holds a worker thread.
+        """
+        handler = cls.__new__(cls)
+        handler.request = request
+        handler.client_address = client_address
+        handler.server = server
+        handler.directory = os.getcwd()
+        handler.close_connection = True
+        handler.setup()
+        return handler
+
+    def handle_available(self):
+        """Serve the requests that have arrived; returns True to keep the connection open."""
+        while True:
+            self.handle_one_request()
+            if self.close_connection:
+                return False
+            if not self.request_buffered():
+                return True
+
+    def request_buffered(self):
+        """Whether more request bytes can be read right now without waiting."""
+        # Pipelined requests may already sit in rfile's buffer, where a selector can't see them
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def handle_one_request(self):
+        """Handle one request and record its status, latency and body size."""
+        started = time.perf_counter()
+        self.response_status = None
+        self.body_bytes = 0
+        super().handle_one_request()
+        if self.response_status is not None:
+            HTTP_METRICS.observe_request(self.response_status, time.perf_counter() - started,
+                                         self.body_bytes)
+
+    def send_response(self, code, message=None):
+        """Send the status line plus keep-alive bookkeeping headers."""
+        self.response_status = int(code)
+        super().send_response(code, message)
+        self.requests_handled += 1
+        if self.requests_handled >= MAX_KEEPALIVE_REQUESTS or self.server.draining:
+            self.send_header('Connection', 'close')
+        elif not self.close_connection:
+            remaining = MAX_KEEPALIVE_REQUESTS - self.requests_handled
+            self.send_header('Keep-Alive', f'timeout={KEEPALIVE_TIMEOUT}, max={remaining}')
+
     def do_GET(self):
         """Handle GET requests."""
+        self.handle_page_request(include_body=True)
+
+    def do_HEAD(self):
+        """Handle HEAD requests (same headers as GET, no body)."""
+        self.handle_page_request(include_body=False)
+
+    def handle_page_request(self, include_body):
+        """Route a GET/HEAD request."""
         # Decode the path to handle special characters
         path = unquote(self.path)
 
         # Serve the coin page for root requests
         if path == "/" or path == "":
-            self.serve_coin_page()
+            self.serve_page(include_body)
         elif path == "/torcoin.html" or path == f"/{HTML_FILE}":
-            self.serve_coin_page()
+            self.serve_page(include_body)
+        elif static_file_name(self.path):
+            self.serve_static_file(static_file_name(self.path), include_body)
         else:
             # For any other requests, redirect to the main page
             self.send_response(302)
-            self.send_header('Location', f'http://{HOST_IP}:{PORT}/')
+            self.send_header('Location', f'http://{HOST_IP}:{self.port}/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def serve_page(self, include_body):
+        """Serve the coin page from memory, or from disk in static-file mode."""
+        if self.serve_page_from_disk:
+            self.serve_static_file(HTML_FILE, include_body)
+        else:
+            self.serve_coin_page(include_body)
+
+    def serve_static_file(self, filename, include_body=True):
+        """Serve a file from disk with sendfile, honoring Range and validators."""
+        try:
+            f = open(filename, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = f'"{st.st_mtime_ns:x}-{size:x}"'
+            validator_headers = [
+                ('ETag', etag),
+                ('Last-Modified', email.utils.formatdate(st.st_mtime, usegmt=True)),
+                ('Cache-Control', 'no-cache'),
+                ('Accept-Ranges', 'bytes'),
+            ]
+
+            if is_not_modified(etag, st.st_mtime, self.headers.get('If-None-Match'),
+                               self.headers.get('If-Modified-Since')):
+                self.send_response(304)
+                for header, value in validator_headers:
+                    self.send_header(header, value)
+                self.end_headers()
+                return
+
+            # If-Range: only honor Range when the client's copy is still current
+            byte_range = parse_range(self.headers.get('Range'), size)
+            if_range = self.headers.get('If-Range')
+            if byte_range is not None and if_range:
+                if if_range.startswith('"') or if_range.startswith('W/'):
+                    current = if_range == etag
+                else:
+                    since = parse_http_date(if_range)
+                    current = since is not None and int(st.st_mtime) <= since
+                if not current:
+                    byte_range = None
+
+            if byte_range == "unsatisfiable":
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            if content_type.startswith('text/'):
+                content_type += '; charset=utf-8'
+
+            if byte_range is None:
+                offset, count = 0, size
+                self.send_response(200)
+            else:
+                offset, count = byte_range[0], byte_range[1] - byte_range[0] + 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {byte_range[0]}-{byte_range[1]}/{size}')
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(count))
+            for header, value in validator_headers:
+                self.send_header(header, value)
             self.end_headers()
 
-    def serve_coin_page(self):
+            if not include_body or count == 0:
+                return
+            self.body_bytes = count
+            if self.connection is None:
+                # The asyncio backend sends the file itself after the headers
+                self.pending_file = (filename, offset, count)
+                return
+            # Zero-copy: os.sendfile where available, plain send() fallback elsewhere
+            self.connection.sendfile(f, offset, count)
+
+    def serve_coin_page(self, include_body=True):
         """Serve the TorCOIN HTML page."""
         try:
-            # Check if the HTML file exists
-            if not os.path.exists(HTML_FILE):
+            # Fetch the pre-encoded page (reloaded only when the file changes)
+            page = PAGE_CACHE.get(HTML_FILE)
+            if page is None:
                 self.send_error(404, "Coin file not found")
                 return
 
-            # Read the HTML file
-            with open(HTML_FILE, 'r', encoding='utf-8') as f:
-                content = f.read()
+            # Pick the pre-compressed variant the client accepts
+            variant = page.select(self.headers.get('Accept-Encoding'))
+
+            # Revalidation: answer with a bodyless 304 when the client's copy is current
+            if page.is_not_modified(variant, self.headers.get('If-None-Match'),
+                                    self.headers.get('If-Modified-Since')):
+                self.send_response(304)
+                for header, value in variant.validator_headers:
+                    self.send_header(header, value)
+                self.end_headers()
+                return
 
             # Send the response
             self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.send_header('Content-length', len(content.encode('utf-8')))
-            self.send_header('Cache-Control', 'no-cache')
+            for header, value in variant.headers:
+                self.send_header(header, value)
             self.end_headers()
 
             # Write the content
-            self.wfile.write(content.encode('utf-8'))
+            if include_body:
+                self.wfile.write(variant.body)
+                self.body_bytes = len(variant.body)
 
         except Exception as e:
             self.send_error(500, f"Server error: {str(e)}")
 
+    def log_request(self, code='-', size='-'):
+        """Queue one access record per response (never blocks the request)."""
+        if isinstance(code, http.HTTPStatus):
+            code = code.value
+        ACCESS_LOG.log(f"[+] {self.command} {self.path} {code} -> {self.address_string()}",
+                       client=self.client_address[0], method=self.command,
+                       path=self.path, status=code)
+
+    def log_error(self, format, *args):
+        """Log errors, except an idle connection timing out before its next request."""
+        # BaseHTTPRequestHandler logs every socket timeout; with keep-alive, one
+        # between requests is just the client going away (idle is cleared
+        # once a request line has been read)
+        if self.idle and args and isinstance(args[0], TimeoutError):
+            return
+        super().log_error(format, *args)
+
     def log_message(self, format, *args):
-        """Override logging to show custom messages."""
-        # Only log important messages, suppress directory listings
-        if "GET /" in format and "200" in format:
-            print(f"[+] Served coin page to {self.address_string()}")
-        elif "404" in format:
-            print(f"[!] File not found: {self.path}")
-        elif "500" in format:
-            print(f"[!] Server error: {self.path}")
+        """Errors and other messages go to the access log unsampled."""
+        ACCESS_LOG.log(f"[!] {format % args}", sample=False,
+                       client=self.client_address[0], path=getattr(self, 'path', None))
+
+class ThreadPoolCoinServer(DrainingServerMixin, socketserver.TCPServer):
+    """TCP server that handles requests on a bounded pool of worker threads.
+
+    Workers only serve requests that have arrived. Between requests, open
+    connections wait in a selector on the idle-watcher thread, so idle
+    keep-alive clients never hold a worker; the watcher also closes them
+    once their idle timeout passes.
+    """
+
+    # Rebind immediately on restart instead of waiting out TIME_WAIT connections
+    allow_reuse_address = True
+
+    def __init__(self, server_address, RequestHandlerClass, max_threads=MAX_THREADS,
+                 max_connections=MAX_CONNECTIONS, backlog=BACKLOG, bind_and_activate=True):
+        self.request_queue_size = backlog
+        self._pool = ThreadPoolExecutor(max_workers=max_threads,
+                                        thread_name_prefix="coin-worker")
+        # Blocking on this in the accept loop leaves extra clients in the kernel backlog
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+        # Connections waiting for their next request: handler -> idle deadline.
+        # Only the watcher thread touches the selector; others queue via _parking.
+        self._selector = selectors.DefaultSelector()
+        self._idle = {}
+        self._parking = []
+        self._parking_lock = threading.Lock()
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+        self._closed = False
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self._watcher = threading.Thread(target=self._watch_idle_connections,
+                                         name="coin-idle-watcher", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        """Park the new connection until its first request arrives."""
+        self._connection_slots.acquire()
+        try:
+            handler = self.RequestHandlerClass.open_connection(request, client_address, self)
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            self._connection_slots.release()
+            return
+        self._park(handler)
+
+    def _serve_available(self, handler):
+        """Worker: serve what the client sent, then park or close the connection."""
+        try:
+            keep_open = handler.handle_available()
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+            keep_open = False
+        if keep_open:
+            self._park(handler)
+        else:
+            self._close_connection(handler)
+
+    def _park(self, handler):
+        # DrainingServerMixin.drain() closes parked connections straight away
+        handler.idle = True
+        with self._parking_lock:
+            self._parking.append(handler)
+        self._wake_watcher()
+
+    def _wake_watcher(self):
+        try:
+            self._wakeup_send.send(b"\0")
+        except OSError:
+            # Buffer full (a wakeup is already pending) or the server is closed
+            pass
+
+    def _close_connection(self, handler):
+        try:
+            handler.finish()
+        except Exception:
+            pass
+        self.shutdown_request(handler.request)
+        self._connection_slots.release()
+
+    def _watch_idle_connections(self):
+        """Hand connections to the pool when they become readable; close expired ones."""
+        while not self._closed:
+            timeout = None
+            if self._idle:
+                timeout = max(0, min(self._idle.values()) - time.monotonic())
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wakeup_recv:
+                    try:
+                        while self._wakeup_recv.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                handler = key.data
+                self._selector.unregister(handler.connection)
+                del self._idle[handler]
+                handler.idle = False
+                try:
+                    self._pool.submit(self._serve_available, handler)
+                except RuntimeError:
+                    # Pool already shut down
+                    self._close_connection(handler)
+
+            with self._parking_lock:
+                parking, self._parking = self._parking, []
+            now = time.monotonic()
+            for handler in parking:
+                timeout = KEEPALIVE_TIMEOUT if handler.requests_handled else REQUEST_TIMEOUT
+                self._idle[handler] = now + timeout
+                self._selector.register(handler.connection, selectors.EVENT_READ, handler)
+
+            for handler, deadline in list(self._idle.items()):
+                if deadline <= now:
+                    # An idle timeout between requests is a normal close, not an error
+                    self._selector.unregister(handler.connection)
+                    del self._idle[handler]
+                    self._close_connection(handler)
+
+        for handler in list(self._idle):
+            self._selector.unregister(handler.connection)
+            self._close_connection(handler)
+        self._idle.clear()
+
+    def drain(self):
+        cut_off = super().drain()
+        # Requests already handed to a worker finish before the pool exits
+        self._pool.shutdown(wait=True)
+        return cut_off
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+        if not self._closed:
+            self._closed = True
+            self._wake_watcher()
+            self._watcher.join()
+            self._selector.close()
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
+
+class SingleCoinServer(DrainingServerMixin, socketserver.TCPServer):
+    """One connection at a time; shutdown() only has the current one to finish."""
+
+class AsyncCoinServer:
+    """asyncio-based server that runs the regular request handler per request.
+
+    Sockets are read and written on the event loop; the handler only builds
+    the response into a memory buffer, so slow clients never hold a thread.
+    """
+
+    draining = False
+    drain_timeout = DRAIN_TIMEOUT
+
+    def __init__(self, server_address, RequestHandlerClass, max_connections=MAX_CONNECTIONS,
+                 backlog=BACKLOG, reuse_port=False, listen_socket=None):
+        self.server_address = server_address
+        self.RequestHandlerClass = RequestHandlerClass
+        self.max_connections = max_connections
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+        self.listen_socket = listen_socket
+        self._loop = None
+        self._stopped = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        """Run the event loop until shutdown() is called."""
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        """Stop serve_forever() from another thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def server_close(self):
+        pass
+
+    def fileno(self):
+        """The listening socket's file descriptor (for SIGHUP handoff)."""
+        return self._listen_fd
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._connection_slots = asyncio.Semaphore(self.max_connections)
+        self._connections = {}
+        self._idle = set()  # Connection tasks waiting for their next request
+        if self.listen_socket is not None:
+            server = await asyncio.start_server(self._handle_connection, sock=self.listen_socket,
+                                                backlog=self.backlog)
+        else:
+            host, port = self.server_address
+            server = await asyncio.start_server(self._handle_connection, host, port,
+                                                backlog=self.backlog,
+                                                reuse_port=self.reuse_port or None)
+        self.server_address = server.sockets[0].getsockname()[:2]
+        self._listen_fd = server.sockets[0].fileno()
+        async with server:
+            await self._stopped.wait()
+
+            # Stop accepting, then let in-flight requests finish
+            self.draining = True
+            server.close()
+            await drain_connections(self._connections, self._idle, self.drain_timeout)
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        async with self._connection_slots:
+            client_address = writer.get_extra_info("peername") or ("", 0)
+            requests_handled = 0
+            HTTP_METRICS.active_connections.inc()
+            try:
+                while not self.draining:
+                    # The first request gets the full timeout, later ones the keep-alive idle timeout
+                    timeout = KEEPALIVE_TIMEOUT if requests_handled else REQUEST_TIMEOUT
+                    request = await self._read_request(reader, timeout)
+                    if not request:
+                        break
+                    response, close_connection, pending_file = self._run_handler(
+                        request, client_address, requests_handled)
+                    requests_handled += 1
+                    writer.write(response)
+                    await writer.drain()
+                    if pending_file is not None:
+                        await self._send_file(writer, *pending_file)
+                    if close_connection:
+                        break
+            except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                HTTP_METRICS.active_connections.dec()
+                writer.close()
+                self._connections.pop(task, None)
+                self._idle.discard(task)
+
+    async def _read_request(self, reader, timeout=REQUEST_TIMEOUT):
+        """Read one request (headers plus any Content-Length body)."""
+        # The connection counts as idle (closed at once when draining) until its first byte
+        task = asyncio.current_task()
+        self._idle.add(task)
+        try:
+            head = await asyncio.wait_for(reader.readexactly(1), timeout)
+        except asyncio.IncompleteReadError:
+            return b""
+        finally:
+            self._idle.discard(task)
+        try:
+            head += await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return b""
+
+        length = 0
+        for line in head.split(b"\r\n"):
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                try:
+                    length = int(value.strip())
+                except ValueError:
+                    length = 0
+                break
+
+        if length > 0:
+            head += await asyncio.wait_for(reader.readexactly(length), REQUEST_TIMEOUT)
+        return head
+
+    def _run_handler(self, request, client_address, requests_handled=0):
+        """Run the request handler against in-memory files."""
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.server = self
+        handler.client_address = client_address
+        handler.requests_handled = requests_handled
+        handler.request = None
+        handler.connection = None
+        handler.directory = os.getcwd()
+        handler.rfile = io.BytesIO(request)
+        handler.wfile = io.BytesIO()
+        handler.close_connection = True
+        try:
+            handler.handle_one_request()
+        except Exception as e:
+            ACCESS_LOG.log(f"[!] Server error: {e}", sample=False)
+            return b"", True, None
+        return handler.wfile.getvalue(), handler.close_connection, handler.pending_file
+
+    async def _send_file(self, writer, filename, offset, count):
+        """Send part of a file with loop.sendfile (zero-copy where supported)."""
+        with open(filename, 'rb') as f:
+            await self._loop.sendfile(writer.transport, f, offset, count)
+
+class SingleConnectionHandler(CoinHTTPRequestHandler):
+    """HTTP/1.0 handler for single mode, where an idle keep-alive client would block everyone."""
+
+    protocol_version = "HTTP/1.0"
+
+def create_server(mode, server_address, max_threads=MAX_THREADS,
+                  max_connections=MAX_CONNECTIONS, backlog=BACKLOG, reuse_port=False,
+                  listen_socket=None):
+    """Create a server for the requested concurrency mode.
+
+    With reuse_port, several processes can listen on the same address and
+    the kernel spreads new connections across them (prefork mode). With
+    listen_socket, the server takes over an already listening socket
+    instead of binding (SIGHUP restart).
+    """
+    if mode == "asyncio":
+        return AsyncCoinServer(server_address, CoinHTTPRequestHandler,
+                               max_connections=max_connections, backlog=backlog,
+                               reuse_port=reuse_port, listen_socket=listen_socket)
+    if mode == "threaded":
+        server = ThreadPoolCoinServer(server_address, CoinHTTPRequestHandler,
+                                      max_threads=max_threads,
+                                      max_connections=max_connections, backlog=backlog,
+                                      bind_and_activate=False)
+    else:
+        server = SingleCoinServer(server_address, SingleConnectionHandler,
+                                  bind_and_activate=False)
+    if listen_socket is not None:
+        server.socket.close()
+        server.socket = listen_socket
+        server.server_address = listen_socket.getsockname()
+        return server
+    try:
+        if reuse_port:
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server.server_bind()
+        server.server_activate()
+    except BaseException:
+        server.server_close()
+        raise
+    return server
+
+def run_worker(args, slot, ready):
+    """Prefork worker: warm the page cache, then serve on the shared port until SIGTERM."""
+    # Ctrl+C reaches the whole process group; the supervisor decides how workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if args.log_file:
+        args.log_file = f"{args.log_file}.{slot}"
+    configure_from_args(ACCESS_LOG, args)
+    CoinHTTPRequestHandler.serve_page_from_disk = args.static
+    CoinHTTPRequestHandler.port = args.port
+    PAGE_CACHE.minify = not args.no_minify
+
+    # Compress the page before taking traffic, so no request pays for it
+    PAGE_CACHE.get(HTML_FILE)
+    server = create_server(args.mode, (HOST_IP, args.port), max_threads=args.threads,
+                           max_connections=args.max_connections, backlog=args.backlog,
+                           reuse_port=True)
+    server.drain_timeout = args.drain_timeout
+    if args.metrics_port:
+        try:
+            start_metrics_server(METRICS, args.metrics_port + slot, reuse_port=True)
+        except OSError as e:
+            print(f"[!] Worker {slot}: metrics endpoint disabled: {e}")
+
+    # shutdown() waits for serve_forever() to return, so it can't run on this thread
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+        target=server.shutdown, daemon=True).start())
+    ready.set()
+    with server:
+        server.serve_forever()
+
+class PreforkSupervisor:
+    """Runs worker processes that share --port through SO_REUSEPORT.
+
+    Crashed workers are restarted (with backoff if they keep crashing).
+    When HTML_FILE changes, or on SIGHUP, workers are replaced one slot at a
+    time: the new worker warms its page cache and starts listening before
+    the old one is told to stop, so the port never goes unserved.
+    """
+
+    def __init__(self, args, workers):
+        self.args = args
+        self.workers = workers
+        self._context = multiprocessing.get_context()
+        self._processes = [None] * workers
+        self._restart_delay = [0] * workers
+        self._restart_at = [0] * workers
+        self._started_at = [0] * workers
+        self._stopping = False
+        self._reload_requested = False
+
+    def run(self):
+        """Start the workers and supervise them until SIGINT/SIGTERM."""
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._request_reload)
+
+        for slot in range(self.workers):
+            self._processes[slot] = self._start_worker(slot)
+        html_state = self._html_state()
+
+        try:
+            while not self._stopping:
+                time.sleep(SUPERVISOR_INTERVAL)
+                self._restart_crashed_workers()
+
+                state = self._html_state()
+                if state != html_state:
+                    # Wait for the next tick in case the file is still being written
+                    time.sleep(SUPERVISOR_INTERVAL)
+                    html_state = self._html_state()
+                    print(f"[+] {HTML_FILE} changed, reloading workers")
+                    self._reload_requested = True
+                if self._reload_requested and not self._stopping:
+                    self._reload_requested = False
+                    self.reload()
+        finally:
+            self.stop()
+
+    def reload(self):
+        """Replace every worker without closing the listening port."""
+        for slot in range(self.workers):
+            if self._stopping:
+                return
+            process, ready = self._spawn(slot)
+            if not ready.wait(WORKER_STARTUP_TIMEOUT):
+                print(f"[!] Worker {slot}: replacement did not start, keeping the old one")
+                self._stop_process(process)
+                continue
+            old, self._processes[slot] = self._processes[slot], process
+            self._started_at[slot] = time.monotonic()
+            if old is not None:
+                self._stop_process(old)
+        print(f"[+] Reloaded {self.workers} workers")
+
+    def stop(self):
+        """Gracefully stop every worker."""
+        self._stopping = True
+        processes = [process for process in self._processes if process is not None]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.args.drain_timeout + WORKER_EXIT_GRACE
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    def _spawn(self, slot):
+        ready = self._context.Event()
+        process = self._context.Process(target=run_worker, args=(self.args, slot, ready),
+                                        name=f"coin-worker-{slot}")
+        process.start()
+        return process, ready
+
+    def _start_worker(self, slot):
+        process, ready = self._spawn(slot)
+        self._started_at[slot] = time.monotonic()
+        if ready.wait(WORKER_STARTUP_TIMEOUT):
+            print(f"[+] Worker {slot} started (pid {process.pid})")
+        return process
+
+    def _restart_crashed_workers(self):
+        now = time.monotonic()
+        for slot, process in enumerate(self._processes):
+            if process is None or process.is_alive() or self._stopping:
+                continue
+            if not self._restart_at[slot]:
+                # Crash loops back off exponentially; a worker that ran a while resets it
+                if now - self._started_at[slot] > MAX_RESTART_DELAY:
+                    self._restart_delay[slot] = 0
+                self._restart_delay[slot] = min(MAX_RESTART_DELAY,
+                                                self._restart_delay[slot] * 2 or 1)
+                self._restart_at[slot] = now + self._restart_delay[slot]
+                print(f"[!] Worker {slot} (pid {process.pid}) exited with code "
+                      f"{process.exitcode}, restarting in {self._restart_delay[slot]}s")
+            if now >= self._restart_at[slot]:
+                self._restart_at[slot] = 0
+                self._processes[slot] = self._start_worker(slot)
+
+    def _stop_process(self, process):
+        process.terminate()
+        process.join(self.args.drain_timeout + WORKER_EXIT_GRACE)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+    @staticmethod
+    def _html_state():
+        try:
+            st = os.stat(HTML_FILE)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="TorCOIN Web Server")
+    parser.add_argument("--port", type=int, default=PORT,
+                        help=f"port to listen on; run several instances behind torcoin_proxy.py "
+                             f"--upstream to scale out (default: {PORT})")
+    parser.add_argument("--mode", choices=SERVER_MODES, default=DEFAULT_MODE,
+                        help=f"concurrency backend (default: {DEFAULT_MODE})")
+    parser.add_argument("--threads", type=int, default=MAX_THREADS,
+                        help=f"worker threads for threaded mode (default: {MAX_THREADS})")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help=f"concurrent connection cap (default: {MAX_CONNECTIONS})")
+    parser.add_argument("--backlog", type=int, default=BACKLOG,
+                        help=f"listen backlog (default: {BACKLOG})")
+    parser.add_argument("--static", action="store_true",
+                        help="serve the coin page from disk with sendfile instead of the memory cache")
+    parser.add_argument("--no-minify", action="store_true",
+                        help="cache the coin page as written instead of minifying its "
+                             "HTML/CSS/JS")
+    parser.add_argument("--prefork", action="store_true",
+                        help="run --workers processes sharing the port via SO_REUSEPORT")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes in prefork mode (default: CPU count)")
+    add_lifecycle_arguments(parser)
+    add_logging_arguments(parser)
+    add_metrics_arguments(parser, METRICS_PORT)
+    return parser.parse_args(argv)
 
 def main():
     """Main server function."""
+    args = parse_args()
+    CoinHTTPRequestHandler.serve_page_from_disk = args.static
+    CoinHTTPRequestHandler.port = args.port
+    PAGE_CACHE.minify = not args.no_minify
+    configure_from_args(ACCESS_LOG, args)
+
     print("=" * 50)
     print("        TORCOIN WEB SERVER")
     print("=" * 50)
-    print(f"Server bound to: {HOST_IP}:{PORT}")
+    print(f"Server bound to: {HOST_IP}:{args.port}")
     print(f"HTML File: {HTML_FILE}")
+    print(f"Mode: {args.mode} (max connections: {args.max_connections}, backlog: {args.backlog})")
+    if args.prefork:
+        print(f"Prefork: {args.workers} worker processes")
     print()
     print("🎯 ULTRA HARDCODED ACCESS LINK:")
     print(DISPLAY_URL)
@@ -84,6 +1112,8 @@ def main():
     print("(Note: Domain must be configured in DNS/hosts file)")
     print()
     print("Press Ctrl+C to stop the server")
+    if HANDOFF_SUPPORTED and not args.prefork:
+        print("Send SIGHUP to restart without dropping connections")
     print("=" * 50)
 
     # Check if HTML file exists
@@ -92,23 +1122,66 @@ def main():
         print("Make sure torcoin.html is in the same directory as this script.")
         sys.exit(1)
 
-    # Create server
+    # Load the page and build its minified and compressed variants before the first request
+    page = PAGE_CACHE.get(HTML_FILE)
+    if PAGE_CACHE.minify:
+        saved = 100 - len(page.body) * 100 // page.size
+        print(f"[+] minified: {len(page.body)} of {page.size} bytes ({saved}% smaller)")
+    for encoding in page.encodings:
+        size = len(page.variants[encoding].body)
+        saved = 100 - size * 100 // page.size
+        print(f"[+] {encoding}: {size} bytes ({saved}% smaller)")
+
+    if args.prefork:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            print("[!] Prefork mode needs SO_REUSEPORT, which this platform does not support")
+            sys.exit(1)
+        print(f"[+] Starting {args.workers} workers on {HOST_IP}:{args.port}")
+        print(f"[+] Workers reload automatically when {HTML_FILE} changes")
+        print()
+        PreforkSupervisor(args, args.workers).run()
+        print("\n[!] Server stopped")
+        return
+
+    # Create server (on the socket handed over by a SIGHUP restart, if any)
+    listen_socket = inherited_socket()
     try:
-        with socketserver.TCPServer((HOST_IP, PORT), CoinHTTPRequestHandler) as httpd:
-            print(f"[+] Server started successfully on {HOST_IP}:{PORT}")
+        with create_server(args.mode, (HOST_IP, args.port), max_threads=args.threads,
+                           max_connections=args.max_connections,
+                           backlog=args.backlog, listen_socket=listen_socket) as httpd:
+            httpd.drain_timeout = args.drain_timeout
+            if listen_socket is not None:
+                print(f"[+] Took over the listening socket on {HOST_IP}:{args.port} "
+                      f"(pid {os.getpid()})")
+            else:
+                print(f"[+] Server started successfully on {HOST_IP}:{args.port}")
+            if args.metrics_port and listen_socket is not None:
+                # The process this one replaces holds the port until it has drained
+                start_metrics_server_after_handoff(METRICS, args.metrics_port,
+                                                   HANDOFF_TIMEOUT + args.drain_timeout,
+                                                   log=lambda message: print(f"[*] {message}"))
+            elif args.metrics_port:
+                try:
+                    start_metrics_server(METRICS, args.metrics_port)
+                    print(f"[+] Metrics at http://{METRICS_HOST}:{args.metrics_port}/metrics")
+                except OSError as e:
+                    print(f"[!] Metrics endpoint disabled: {e}")
             print("[+] Ready to serve your 3D coin!")
             print()
 
-            # Start serving
+            # Start serving; SIGTERM/Ctrl+C and SIGHUP drain before serve_forever() returns
+            Lifecycle(httpd, log=lambda message: print(f"[*] {message}")).install()
+            notify_ready()
             httpd.serve_forever()
+        print("[!] Server stopped")
 
     except PermissionError:
-        print(f"[!] Permission denied. Try running with sudo (for port {PORT})")
-        print("Or change PORT to a number above 1024 (e.g., 8080)")
+        print(f"[!] Permission denied. Try running with sudo (for port {args.port})")
+        print("Or use --port with a number above 1024 (e.g., 8080)")
         sys.exit(1)
     except OSError as e:
         if "Address already in use" in str(e):
-            print(f"[!] Port {PORT} is already in use. Try a different port.")
+            print(f"[!] Port {args.port} is already in use. Try a different port.")
         else:
             print(f"[!] Error starting server: {e}")
         sys.exit(1)
@@ -10,14 +10,35 @@ import os
 import sys
 from urllib.parse import unquote
 
+from torcoin_logging import AccessLog
+
 # Configuration for testing
 HOST_IP = "127.0.0.1"  # Localhost for testing
 PORT = 50129  # Same port as production
 HTML_FILE = "torcoin.html"
+KEEPALIVE_TIMEOUT = 15  # Seconds an idle keep-alive connection is kept open
+MAX_KEEPALIVE_REQUESTS = 100  # Requests served on one connection before closing it
+
+ACCESS_LOG = AccessLog("TorCOIN-Test")
 
 class CoinHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     """Custom HTTP request handler for serving the coin page."""
 
+    # Persistent connections: pipelined requests are read from the buffered rfile
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    requests_handled = 0
+
+    def send_response(self, code, message=None):
+        """Send the status line plus keep-alive bookkeeping headers."""
+        super().send_response(code, message)
+        self.requests_handled += 1
+        if self.requests_handled >= MAX_KEEPALIVE_REQUESTS:
+            self.send_header('Connection', 'close')
+        elif not self.close_connection:
+            remaining = MAX_KEEPALIVE_REQUESTS - self.requests_handled
+            self.send_header('Keep-Alive', f'timeout={KEEPALIVE_TIMEOUT}, max={remaining}')
+
     def do_GET(self):
         """Handle GET requests."""
         path = unquote(self.path)
@@ -29,6 +50,7 @@ class CoinHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         else:
             self.send_response(302)
             self.send_header('Location', f'http://{HOST_IP}:{PORT}/')
+            self.send_header('Content-Length', '0')
             self.end_headers()
 
     def serve_coin_page(self):
@@ -52,14 +74,23 @@ class CoinHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
         except Exception as e:
             self.send_error(500, f"Server error: {str(e)}")
 
+    def log_request(self, code='-', size='-'):
+        """Queue one access record per response (never blocks the request)."""
+        if isinstance(code, http.HTTPStatus):
+            code = code.value
+        ACCESS_LOG.log(f"[+] {self.command} {self.path} {code} -> {self.address_string()}",
+                       client=self.client_address[0], method=self.command,
+                       path=self.path, status=code)
+
     def log_message(self, format, *args):
-        """Override logging to show custom messages."""
-        if "GET /" in format and "200" in format:
-            print(f"[+] Served coin page to {self.address_string()}")
-        elif "404" in format:
-            print(f"[!] File not found: {self.path}")
-        elif "500" in format:
-            print(f"[!] Server error: {self.path}")
+        """Errors and other messages go to the access log unsampled."""
+        ACCESS_LOG.log(f"[!] {format % args}", sample=False,
+                       client=self.client_address[0], path=getattr(self, 'path', None))
+
+class TestServer(socketserver.ThreadingTCPServer):
+    """Threaded so an idle keep-alive connection doesn't block other test clients."""
+
+    daemon_threads = True
 
 def main():
     """Main server function."""
@@ -83,7 +114,7 @@ def main():
         sys.exit(1)
 
     try:
-        with socketserver.TCPServer((HOST_IP, PORT), CoinHTTPRequestHandler) as httpd:
+        with TestServer((HOST_IP, PORT), CoinHTTPRequestHandler) as httpd:
             print(f"[+] Test server started successfully on {HOST_IP}:{PORT}")
             httpd.serve_forever()
 
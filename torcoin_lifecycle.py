@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+TorCOIN Server Lifecycle
+Graceful shutdown and zero-downtime restarts shared by coin_server.py and
+torcoin_proxy.py.
+
+SIGTERM or Ctrl+C stops accepting, closes idle keep-alive connections,
+lets in-flight requests finish (up to --drain-timeout) and exits; a second
+Ctrl+C exits at once. SIGHUP (Linux/macOS) starts a new copy of the
+program that inherits the listening socket, waits until it is serving and
+then drains this process the same way, so the port never refuses a
+connection during a deploy.
+"""
+
+import asyncio
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# Defaults
+DRAIN_TIMEOUT = 20  # Seconds in-flight requests get to finish on shutdown
+DRAIN_POLL_INTERVAL = 0.05  # Seconds between checks while draining
+HANDOFF_TIMEOUT = 60  # Seconds a new process gets to start serving before a restart is abandoned
+LISTEN_FD_ENV = "TORCOIN_LISTEN_FD"  # Listening socket passed to the new process
+READY_FD_ENV = "TORCOIN_READY_FD"  # Pipe the new process writes to once it is serving
+HANDOFF_SUPPORTED = hasattr(signal, "SIGHUP")  # Needs POSIX fd inheritance
+
+def inherited_socket():
+    """Return the listening socket handed down by a SIGHUP restart, or None."""
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is None:
+        return None
+    return socket.socket(fileno=int(fd))
+
+def notify_ready():
+    """Tell the process that started this one (SIGHUP restart) that it is serving."""
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is None:
+        return
+    try:
+        os.write(int(fd), b"1")
+        os.close(int(fd))
+    except OSError:
+        pass
+
+def spawn_successor(listen_fd, timeout=HANDOFF_TIMEOUT):
+    """Start a new copy of this program serving on listen_fd.
+
+    Returns the new process id once it reports that it is serving, or None
+    if it exits or times out first (it is killed then).
+    """
+    read_fd, write_fd = os.pipe()
+    env = dict(os.environ)
+    env[LISTEN_FD_ENV] = str(listen_fd)
+    env[READY_FD_ENV] = str(write_fd)
+    try:
+        process = subprocess.Popen([sys.executable] + sys.argv, env=env,
+                                   pass_fds=(listen_fd, write_fd))
+    finally:
+        os.close(write_fd)
+    try:
+        # EOF (the new process died) also wakes this up
+        readable, _, _ = select.select([read_fd], [], [], timeout)
+        ready = bool(readable) and os.read(read_fd, 1) == b"1"
+    finally:
+        os.close(read_fd)
+    if ready:
+        return process.pid
+    process.kill()
+    process.wait()
+    return None
+
+class DrainingServerMixin:
+    """socketserver mixin: once shutdown() is called, serve_forever() drains before returning.
+
+    Handlers using DrainingHandlerMixin register themselves. Idle keep-alive
+    connections are closed at once; busy ones close after their current
+    response, or are cut off when drain_timeout runs out.
+    """
+
+    draining = False
+    drain_timeout = DRAIN_TIMEOUT
+
+    def __init__(self, *args, **kwargs):
+        self._handlers = set()
+        self._handlers_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def serve_forever(self, poll_interval=0.5):
+        super().serve_forever(poll_interval)
+        self.drain()
+
+    def add_handler(self, handler):
+        with self._handlers_lock:
+            self._handlers.add(handler)
+
+    def remove_handler(self, handler):
+        with self._handlers_lock:
+            self._handlers.discard(handler)
+
+    def drain(self):
+        """Wait for open connections to finish; returns how many were cut off."""
+        self.draining = True
+        deadline = time.monotonic() + self.drain_timeout
+        while True:
+            with self._handlers_lock:
+                handlers = list(self._handlers)
+            if not handlers:
+                return 0
+            expired = time.monotonic() >= deadline
+            for handler in handlers:
+                if handler.idle or expired:
+                    handler.abort()
+            if expired:
+                return len(handlers)
+            time.sleep(DRAIN_POLL_INTERVAL)
+
+class DrainingHandlerMixin:
+    """BaseHTTPRequestHandler mixin for servers using DrainingServerMixin."""
+
+    # True while waiting for the next request on the connection
+    idle = False
+
+    def setup(self):
+        super().setup()
+        self.server.add_handler(self)
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.server.remove_handler(self)
+
+    def handle_one_request(self):
+        self.idle = True
+        super().handle_one_request()
+        self.idle = False
+        if self.server.draining:
+            self.close_connection = True
+
+    def parse_request(self):
+        # Called as soon as the request line has been read
+        self.idle = False
+        return super().parse_request()
+
+    def abort(self):
+        """Close the connection under the handler; its blocked read or write fails."""
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+async def drain_connections(connections, idle, timeout):
+    """asyncio counterpart of DrainingServerMixin.drain().
+
+    connections maps each connection task to its writer; idle holds the
+    tasks waiting for their next request. Returns how many were cut off.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while connections:
+        for task, writer in list(connections.items()):
+            if task in idle:
+                writer.close()
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.wait(list(connections), timeout=min(remaining, DRAIN_POLL_INTERVAL))
+
+    cut_off = list(connections)
+    for task in cut_off:
+        task.cancel()
+    if cut_off:
+        await asyncio.gather(*cut_off, return_exceptions=True)
+    return len(cut_off)
+
+class Lifecycle:
+    """Signal handling for a serving process: graceful stop and socket handoff.
+
+    server needs serve_forever()/shutdown() (shutdown from another thread)
+    and fileno() for its listening socket; serve_forever() is expected to
+    drain before it returns.
+    """
+
+    def __init__(self, server, log=print):
+        self.server = server
+        self.log = log
+        self.stopping = False
+        self._restarting = False
+
+    def install(self):
+        """Install the handlers; call from the main thread before serve_forever()."""
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        if HANDOFF_SUPPORTED:
+            signal.signal(signal.SIGHUP, self._restart)
+
+    def _stop(self, signum, frame):
+        if self.stopping:
+            # Second Ctrl+C: stop waiting for connections
+            raise KeyboardInterrupt
+        self.stopping = True
+        self.log("Stopping: finishing in-flight requests (Ctrl+C again to quit now)")
+        self._shutdown()
+
+    def _shutdown(self):
+        # shutdown() waits for serve_forever() to return, so it can't run on this thread
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _restart(self, signum, frame):
+        if self.stopping or self._restarting:
+            return
+        self._restarting = True
+        threading.Thread(target=self._hand_off, name="handoff", daemon=True).start()
+
+    def _hand_off(self):
+        self.log("Restarting: starting a new process on the listening socket")
+        try:
+            pid = spawn_successor(self.server.fileno())
+        except OSError as e:
+            self.log(f"Restart failed: {e}")
+            pid = None
+        if pid is None:
+            self.log("New process did not start serving, keeping this one")
+            self._restarting = False
+            return
+        self.log(f"New process {pid} is serving, draining this one")
+        self.stopping = True
+        self.server.shutdown()
+
+def add_lifecycle_arguments(parser):
+    """Add the shared --drain-timeout option to an argparse parser."""
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT,
+                        help=f"seconds in-flight requests get to finish on shutdown or restart "
+                             f"(default: {DRAIN_TIMEOUT})")
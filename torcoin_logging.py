@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+TorCOIN Access Logging
+Non-blocking log pipeline shared by coin_server.py, test_server.py and
+torcoin_proxy.py. Request threads (or the event loop) only enqueue a
+record; a background thread formats, batches and writes them.
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Defaults
+QUEUE_SIZE = 10000  # Records buffered before new ones are dropped
+BATCH_SIZE = 256  # Records written per batch
+FLUSH_INTERVAL = 0.5  # Seconds the writer waits before flushing a partial batch
+MAX_BYTES = 10 * 1024 * 1024  # Rotate the log file at this size
+BACKUP_COUNT = 5  # Rotated files kept (name.1 ... name.N)
+
+class AccessLog:
+    """Queue-backed logger with batching, JSON lines output, rotation and sampling."""
+
+    def __init__(self, name, path=None, json_lines=False, sample_rate=1.0,
+                 max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, stream=None):
+        self.name = name
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self.configure(path, json_lines, sample_rate, max_bytes, backup_count, stream)
+
+    def configure(self, path=None, json_lines=False, sample_rate=1.0,
+                  max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, stream=None):
+        """Set the output options; call before the first record is logged."""
+        self.path = path
+        self.json_lines = json_lines
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.stream = stream
+
+    def log(self, message, sample=True, **fields):
+        """Queue a record without blocking.
+
+        Records with sample=True (routine access lines) are kept with
+        probability sample_rate; errors and security events should pass
+        sample=False so they are always written.
+        """
+        if sample and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((time.time(), message, fields))
+        except queue.Full:
+            # Never block a request on logging; count what was lost instead
+            self.dropped += 1
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-log",
+                                            daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+
+            batch = [record]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            lines = [self._format(*record) for record in batch if record is not None]
+            if self.dropped:
+                lines.append(self._format(time.time(), f"[!] {self.dropped} log records dropped",
+                                          {}))
+                self.dropped = 0
+            if lines:
+                self._write("".join(lines))
+            if stop:
+                return
+
+    def _format(self, created, message, fields):
+        if self.json_lines:
+            record = {
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(created))
+                      + f".{int(created % 1 * 1000):03d}",
+                "logger": self.name,
+                "msg": message,
+            }
+            record.update(fields)
+            return json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+        return f"[{timestamp}] {self.name}: {message}\n"
+
+    def _write(self, text):
+        try:
+            if self.path is None:
+                stream = self.stream or sys.stdout
+                stream.write(text)
+                stream.flush()
+                return
+
+            data = text.encode("utf-8")
+            if self._file is None:
+                self._file = open(self.path, "ab")
+                self._size = self._file.tell()
+            if self.max_bytes and self._size + len(data) > self.max_bytes and self._size:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+        except (OSError, ValueError):
+            # Logging must never take the server down
+            pass
+
+    def _rotate(self):
+        """Shift name.N-1 -> name.N ... name -> name.1 and start a new file."""
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+        self._size = 0
+
+def add_logging_arguments(parser):
+    """Add the shared --log-* options to an argparse parser."""
+    parser.add_argument("--log-file", default=None,
+                        help="write logs to this file (rotated) instead of stdout")
+    parser.add_argument("--log-json", action="store_true",
+                        help="write structured JSON lines")
+    parser.add_argument("--log-sample", type=float, default=1.0,
+                        help="fraction of routine access lines to keep (default: 1.0)")
+    parser.add_argument("--log-max-bytes", type=int, default=MAX_BYTES,
+                        help=f"rotate the log file at this size (default: {MAX_BYTES})")
+    parser.add_argument("--log-backups", type=int, default=BACKUP_COUNT,
+                        help=f"rotated log files to keep (default: {BACKUP_COUNT})")
+
+def configure_from_args(access_log, args):
+    """Apply parsed --log-* options to an AccessLog."""
+    access_log.configure(path=args.log_file, json_lines=args.log_json,
+                         sample_rate=args.log_sample, max_bytes=args.log_max_bytes,
+                         backup_count=args.log_backups)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+TorCOIN Metrics
+Prometheus-style counters, gauges and histograms shared by coin_server.py
+and torcoin_proxy.py, plus a tiny /metrics endpoint on a separate local port.
+
+Every thread updates its own shard of a metric, so request threads never
+contend on a lock; a scrape sums the shards.
+"""
+
+import bisect
+import http.server
+import socket
+import threading
+import time
+
+# Defaults
+METRICS_HOST = "127.0.0.1"  # /metrics is only reachable from this machine
+METRICS_BIND_RETRY = 0.5  # Seconds between binds while a drained-out process still holds the port
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)  # Seconds
+
+def format_labels(names, values):
+    """Render {name="value",...} for the exposition format."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class ShardedMetric:
+    """Base class: per-thread shards of {label values: value}.
+
+    A thread registers its shard once (under a lock); after that every
+    update is a plain dict operation on memory no other thread writes.
+    Shards of finished threads are folded into a retired total so
+    thread-per-connection servers don't grow the shard list forever.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []  # (thread, values)
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _values(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._fold_finished_shards()
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def _fold_finished_shards(self):
+        live = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                live.append((thread, values))
+            else:
+                self._merge(self._retired, values)
+        self._shards = live
+
+    def _merge(self, target, values):
+        for labels, value in values.items():
+            target[labels] = target.get(labels, 0) + value
+
+    def snapshot(self):
+        """Return {label values: value} summed over all threads."""
+        with self._lock:
+            self._fold_finished_shards()
+            total = {}
+            self._merge(total, self._retired)
+            for _, values in self._shards:
+                # dict.copy() is atomic under the GIL, so a concurrent update can't break it
+                self._merge(total, values.copy())
+        return total
+
+    def value(self, *labels):
+        return self.snapshot().get(labels, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Counter(ShardedMetric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        values = self._values()
+        values[labels] = values.get(labels, 0) + amount
+
+class Gauge(ShardedMetric):
+    """Up/down value such as active connections; dec() may run on another thread."""
+
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        values = self._values()
+        values[labels] = values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(ShardedMetric):
+    """Bucketed distribution; each shard keeps [bucket counts..., +Inf count, sum]."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, *labels):
+        values = self._values()
+        counts = values.get(labels)
+        if counts is None:
+            counts = values[labels] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, amount)] += 1
+        counts[-1] += amount
+
+    def _merge(self, target, values):
+        for labels, counts in values.items():
+            merged = target.get(labels)
+            if merged is None:
+                target[labels] = list(counts)
+            else:
+                for index, count in enumerate(counts):
+                    merged[index] += count
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        for labels, counts in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(names, labels + (bound,))} "
+                             f"{cumulative}")
+            suffix = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {counts[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+class CallbackMetric:
+    """Value computed at scrape time, e.g. a cache hit ratio."""
+
+    def __init__(self, name, documentation, func, kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.kind = kind
+
+    def render(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {self.func()}"]
+
+class MetricsRegistry:
+    """The metrics one process exposes on /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, func, kind="gauge"):
+        return self.register(CallbackMetric(name, documentation, func, kind))
+
+    def render(self):
+        """Return the Prometheus text exposition of every metric."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class HTTPMetrics:
+    """The per-request metrics both servers share, named prefix_*."""
+
+    def __init__(self, registry, prefix):
+        self.requests = registry.counter(f"{prefix}_requests_total",
+                                         "Responses sent, by status code", ("status",))
+        self.latency = registry.histogram(f"{prefix}_request_duration_seconds",
+                                          "Time from reading a request to finishing its response")
+        self.bytes_sent = registry.counter(f"{prefix}_response_bytes_total",
+                                           "Response body bytes sent to clients")
+        self.active_connections = registry.gauge(f"{prefix}_active_connections",
+                                                 "Client connections currently open")
+
+    def observe_request(self, status, seconds, body_bytes=0):
+        self.requests.inc(str(status))
+        self.latency.observe(seconds)
+        if body_bytes:
+            self.bytes_sent.inc(amount=body_bytes)
+
+def hit_ratio(hits, misses):
+    """Hit ratio for a scrape (0 before the first lookup)."""
+    total = hits + misses
+    return hits / total if total else 0.0
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """Serves GET /metrics from the server's registry."""
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404, "Not found")
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the access log
+        pass
+
+def start_metrics_server(registry, port, host=METRICS_HOST, reuse_port=False):
+    """Serve registry on http://host:port/metrics from a daemon thread.
+
+    reuse_port lets a replacement process bind the port before the one it
+    replaces has exited (prefork reloads). Leave it off otherwise, or two
+    unrelated instances on the same port would silently split the scrapes.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler,
+                                             bind_and_activate=False)
+    try:
+        if reuse_port:
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server.server_bind()
+        server.server_activate()
+    except BaseException:
+        server.server_close()
+        raise
+    server.daemon_threads = True
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+def start_metrics_server_after_handoff(registry, port, timeout, log):
+    """Start the /metrics endpoint in a process started by a SIGHUP restart.
+
+    The process being replaced keeps the port until it has drained. With
+    SO_REUSEPORT both can bind when it set the option too (it was itself
+    started by a restart); otherwise the bind is retried from a thread
+    for up to timeout seconds. log(message) reports the outcome.
+    """
+    reuse_port = hasattr(socket, "SO_REUSEPORT")
+
+    def bind():
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                start_metrics_server(registry, port, reuse_port=reuse_port)
+            except OSError as e:
+                if time.monotonic() >= deadline:
+                    log(f"Metrics endpoint disabled: {e}")
+                    return
+                time.sleep(METRICS_BIND_RETRY)
+                continue
+            log(f"Metrics at http://{METRICS_HOST}:{port}/metrics")
+            return
+
+    threading.Thread(target=bind, name="metrics-bind", daemon=True).start()
+
+def add_metrics_arguments(parser, default_port):
+    """Add the shared --metrics-port option to an argparse parser."""
+    parser.add_argument("--metrics-port", type=int, default=default_port,
+                        help=f"local port for the /metrics endpoint, 0 to disable "
+                             f"(default: {default_port})")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+TorCOIN Page Minifier
+Shrinks hand-written HTML with inline <style> and <script> before
+coin_server.py caches and compresses it. The source files are never
+touched; the minified copy lives only in the page cache.
+
+Everything here is deliberately conservative: comments and redundant
+whitespace go, but nothing is renamed or rewritten, so the page renders
+and behaves exactly as the original.
+"""
+
+import re
+
+# Elements whose content is copied verbatim or handed to another minifier
+HTML_TOKEN = re.compile(
+    r"<!--.*?-->"
+    r"|<(script|style|pre|textarea)\b[^>]*>.*?</\1\s*>"
+    r"|<[^>]*>",
+    re.IGNORECASE | re.DOTALL)
+HTML_BLOCK_OPEN = re.compile(r"<(\w+)\b[^>]*>", re.DOTALL)
+HTML_TAG_PART = re.compile(r"(\"[^\"]*\"|'[^']*')|\s+")
+WHITESPACE = re.compile(r"\s+")
+JS_TYPES = ("", "text/javascript", "application/javascript", "module")
+
+CSS_TOKEN = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')|/\*.*?\*/", re.DOTALL)
+# Spaces around these never matter; ":" only loses the space after it,
+# since "a :hover" and "a:hover" are different selectors
+CSS_SPACE_AROUND = re.compile(r"\s*([{};,>])\s*")
+CSS_SPACE_AFTER = re.compile(r":\s+")
+
+# A "/" after one of these starts a regex literal rather than a division
+JS_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^")
+JS_REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "instanceof", "new",
+                     "delete", "void", "throw", "yield", "await"}
+JS_WORD_END = re.compile(r"[\w$]+$")
+# A line break after these, or before the next set, can't end a statement
+# ("+" and "-" are missing on purpose: "a++ <newline> b" is two statements)
+JS_CONTINUES_AFTER = set("{([,;=:?&|<>*%^!~")
+JS_CONTINUES_BEFORE = set(")]},;")
+
+def _collapse(space):
+    """One newline or space in place of a whitespace run."""
+    return "\n" if "\n" in space else " "
+
+def minify_html(text):
+    """Minify an HTML document, including its inline CSS and JavaScript."""
+    out = []
+    position = 0
+    for match in HTML_TOKEN.finditer(text):
+        out.append(WHITESPACE.sub(lambda m: _collapse(m.group()), text[position:match.start()]))
+        position = match.end()
+        token = match.group()
+        if token.startswith("<!--"):
+            # Conditional comments are markup for old IE, not comments
+            if token.startswith("<!--[if"):
+                out.append(token)
+            continue
+        element = (match.group(1) or "").lower()
+        if not element:
+            out.append(_minify_tag(token))
+            continue
+
+        opening = HTML_BLOCK_OPEN.match(token)
+        start_tag, content = opening.group(), token[opening.end():]
+        closing = content.rindex("</")
+        content, end_tag = content[:closing], content[closing:]
+        if element == "style":
+            content = minify_css(content)
+        elif element == "script" and _script_type(start_tag) in JS_TYPES:
+            content = minify_js(content)
+        # <pre>, <textarea> and data blocks such as JSON keep their exact text
+        out.append(_minify_tag(start_tag) + content + _minify_tag(end_tag))
+    out.append(WHITESPACE.sub(lambda m: _collapse(m.group()), text[position:]))
+    return "".join(out).strip()
+
+def _minify_tag(tag):
+    """Collapse whitespace between attributes, leaving quoted values alone."""
+    tag = HTML_TAG_PART.sub(lambda m: m.group(1) or " ", tag)
+    # Not before "/>": in <input value=a /> the space ends the unquoted value
+    return tag[:-2] + ">" if tag.endswith(" >") else tag
+
+def _script_type(start_tag):
+    match = re.search(r"\stype\s*=\s*[\"']?([^\"'\s>]*)", start_tag, re.IGNORECASE)
+    return match.group(1).lower() if match else ""
+
+def minify_css(text):
+    """Strip comments and redundant whitespace from a stylesheet."""
+    out = []
+    code = ""  # Source since the last string literal
+    position = 0
+    for match in CSS_TOKEN.finditer(text):
+        code += text[position:match.start()]
+        position = match.end()
+        if match.group(1) is None:
+            # A comment still separates the tokens on either side of it
+            code += " "
+            continue
+        out.append(_squeeze_css(code))
+        out.append(match.group(1))
+        code = ""
+    out.append(_squeeze_css(code + text[position:]))
+    return "".join(out).strip()
+
+def _squeeze_css(code):
+    code = CSS_SPACE_AROUND.sub(r"\1", WHITESPACE.sub(" ", code))
+    return CSS_SPACE_AFTER.sub(":", code).replace(";}", "}")
+
+def minify_js(text):
+    """Strip comments and redundant whitespace from a script.
+
+    Line breaks are kept wherever automatic semicolon insertion could
+    depend on them; identifiers and literals are never changed.
+    """
+    out = []
+    _JSScanner(text, out).scan_code()
+    return "".join(out).strip()
+
+def _is_js_word(char):
+    return char.isalnum() or char in "_$\\" or ord(char) > 127
+
+def _js_needs_space(before, after):
+    """Whether dropping the space between two characters would change the tokens."""
+    return ((_is_js_word(before) and _is_js_word(after))
+            or (before in "+-" and after in "+-")  # a - -b, a + +b
+            or "/" in (before, after)  # a / /re/ would become a comment
+            or (before.isdigit() and after == ".")  # 1 .toString()
+            or (before == "<" and after == "!"))  # <!-- starts a comment in scripts
+
+class _JSScanner:
+    """Single pass over JavaScript source that copies literals verbatim."""
+
+    def __init__(self, text, out):
+        self.text = text
+        self.out = out
+        self.position = 0
+        self.space = ""  # Whitespace seen since the last token, emitted lazily
+        self.last = ""  # Last character emitted
+
+    def scan_code(self, in_template=False):
+        """Copy code until the end, or the "}" closing a template ${...}."""
+        text = self.text
+        depth = 0
+        while self.position < len(text):
+            char = text[self.position]
+            following = text[self.position + 1:self.position + 2]
+            if char.isspace():
+                self.space += char
+                self.position += 1
+            elif char == "/" and following == "/":
+                end = text.find("\n", self.position)
+                self.position = len(text) if end < 0 else end
+            elif char == "/" and following == "*":
+                end = text.find("*/", self.position + 2)
+                end = len(text) if end < 0 else end + 2
+                # A comment spanning lines still counts as a line break for ASI
+                self.space += "\n" if "\n" in text[self.position:end] else " "
+                self.position = end
+            elif char in "\"'":
+                self._emit(self._read_string(char))
+            elif char == "`":
+                self._emit("`")
+                self.position += 1
+                self._scan_template()
+            elif char == "/" and self._regex_allowed():
+                self._emit(self._read_regex())
+            elif in_template and char == "}" and depth == 0:
+                self._emit("}")
+                self.position += 1
+                return
+            else:
+                if char == "{":
+                    depth += 1
+                elif char == "}":
+                    depth -= 1
+                self._emit(char)
+                self.position += 1
+
+    def _emit(self, token):
+        if self.space and self.last:
+            before, after = self.last, token[0]
+            if ("\n" in self.space and before not in JS_CONTINUES_AFTER
+                    and after not in JS_CONTINUES_BEFORE):
+                self.out.append("\n")
+            elif _js_needs_space(before, after):
+                self.out.append(" ")
+        self.space = ""
+        self.out.append(token)
+        self.last = token[-1]
+
+    def _regex_allowed(self):
+        if not self.last:
+            return True
+        if _is_js_word(self.last):
+            # Only after a keyword; after a name or number it is a division
+            word = JS_WORD_END.search("".join(self.out[-32:]))
+            return word is not None and word.group() in JS_REGEX_KEYWORDS
+        return self.last in JS_REGEX_AFTER
+
+    def _read_string(self, quote):
+        text = self.text
+        start = self.position
+        self.position += 1
+        while self.position < len(text):
+            char = text[self.position]
+            self.position += 2 if char == "\\" else 1
+            if char == quote or char == "\n":
+                break
+        return text[start:self.position]
+
+    def _read_regex(self):
+        text = self.text
+        start = self.position
+        self.position += 1
+        in_class = False
+        while self.position < len(text):
+            char = text[self.position]
+            self.position += 2 if char == "\\" else 1
+            if char == "[":
+                in_class = True
+            elif char == "]":
+                in_class = False
+            elif char == "/" and not in_class:
+                break
+            elif char == "\n":
+                break
+        while self.position < len(text) and text[self.position].isalnum():
+            self.position += 1
+        return text[start:self.position]
+
+    def _scan_template(self):
+        """Copy a template literal, minifying the code inside ${...}."""
+        text = self.text
+        while self.position < len(text):
+            char = text[self.position]
+            if char == "\\":
+                self.out.append(text[self.position:self.position + 2])
+                self.position += 2
+            elif char == "`":
+                self.out.append("`")
+                self.position += 1
+                self.last = "`"
+                return
+            elif text.startswith("${", self.position):
+                self.out.append("${")
+                self.position += 2
+                self.last = "{"
+                self.space = ""
+                self.scan_code(in_template=True)
+            else:
+                self.out.append(char)
+                self.position += 1
@@ -5,188 +5,1927 @@ A strict proxy that ONLY allows access to www.torcoin.cnet:50129
 Blocks all other traffic for maximum security.
 """
 
+import argparse
+import asyncio
+import email.utils
+import html
+import http.client
 import http.server
+import itertools
+import math
+import os
+import select
 import socketserver
-import urllib.request
-import urllib.error
 import socket
-from urllib.parse import urlparse, urljoin
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
 import time
 
+from torcoin_lifecycle import (DRAIN_TIMEOUT, HANDOFF_SUPPORTED, HANDOFF_TIMEOUT,
+                               DrainingHandlerMixin, DrainingServerMixin, Lifecycle,
+                               add_lifecycle_arguments, drain_connections, inherited_socket,
+                               notify_ready)
+from torcoin_logging import AccessLog, add_logging_arguments, configure_from_args
+from torcoin_metrics import (METRICS_HOST, HTTPMetrics, MetricsRegistry, add_metrics_arguments,
+                             hit_ratio, start_metrics_server,
+                             start_metrics_server_after_handoff)
+
 # Hardcoded allowed destination
 ALLOWED_HOST = "127.0.0.1"
 ALLOWED_PORT = 50129
 ALLOWED_URL = f"http://{ALLOWED_HOST}:{ALLOWED_PORT}"
 
-class TorCOINProxyHandler(http.server.BaseHTTPRequestHandler):
+# Upstream backends: coin_server.py instances that serve ALLOWED_URL
+BACKEND_HOSTS = (ALLOWED_HOST, "localhost")  # Backends must run on this machine
+BALANCE_STRATEGIES = ("round-robin", "least-connections")
+DEFAULT_BALANCE = "round-robin"
+HEALTH_CHECK_INTERVAL = 2  # Seconds between active health checks of each backend (0 disables)
+HEALTH_CHECK_TIMEOUT = 1  # Seconds a health check may take
+HEALTH_CHECK_PATH = "/"
+HEALTH_CHECK_FAILURES = 2  # Consecutive failed checks before a backend is taken out
+
+# Upstream connection pool
+UPSTREAM_CONNECT_TIMEOUT = 2  # Seconds to establish a connection (a live local server takes <1ms)
+UPSTREAM_TIMEOUT = 10  # Seconds to wait for upstream data once connected
+UPSTREAM_RETRIES = 2  # Extra attempts for failures that are safe to retry
+RETRY_BACKOFF = 0.05  # Seconds before a retry (doubled each time)
+POOL_MAX_IDLE = 16  # Idle keep-alive connections kept to the upstream
+POOL_IDLE_TIMEOUT = 10  # Seconds before an idle connection is dropped (below the server's keep-alive)
+MAX_REDIRECTS = 5
+# Methods that may be sent again if the upstream fails before answering
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'])
+
+# Circuit breaker
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive upstream failures that open the circuit
+BREAKER_RESET_TIMEOUT = 5  # Seconds the circuit stays open before one probe request
+
+# Proxy engines
+PROXY_PORT = 8080  # Standard proxy port
+PROXY_ENGINES = ("threaded", "asyncio")
+DEFAULT_ENGINE = "threaded"
+BACKLOG = 128  # Listen queue size
+KEEPALIVE_TIMEOUT = 15  # Seconds an idle client connection is kept open
+STREAM_CHUNK = 65536  # Bytes per read when streaming bodies
+METRICS_PORT = 8081  # Local-only port for the /metrics endpoint
+# coin_server.py redirects to its bind address, which is still the allowed server
+UPSTREAM_HOSTNAMES = (ALLOWED_HOST, "localhost", "0.0.0.0")
+
+# Client limits
+RATE_LIMIT = 50.0  # Sustained requests/sec allowed per client IP (0 disables)
+RATE_BURST = 100  # Requests a client IP may send at once before being limited
+MAX_CONNECTIONS = 512  # Concurrent client connections across all clients
+MAX_CONNECTIONS_PER_IP = 64  # Concurrent client connections from one IP
+LIMITER_SHARDS = 16  # Independently locked slices of the per-IP tables
+LIMITER_SWEEP_INTERVAL = 60  # Seconds between lazy sweeps of idle buckets in a shard
+OVERLOAD_RETRY_AFTER = 1  # Retry-After seconds sent when the global cap is hit
+
+# Response cache
+CACHE_MAX_BYTES = 32 * 1024 * 1024  # Total cached body bytes
+CACHE_MAX_ENTRY_BYTES = 2 * 1024 * 1024  # Larger responses are streamed, never cached
+
+# Hop-by-hop headers are never forwarded in either direction
+HOP_BY_HOP_HEADERS = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade',
+])
+
+class ProxyPolicy:
+    """Precompiled strict allow-list and header filters.
+
+    Everything that used to be rebuilt per request (netloc strings, header
+    name lists) is computed once here, and resolve() parses the request
+    target exactly once. Every method and both engines go through it.
+    """
+
+    def __init__(self, host, port, redirect_hostnames=UPSTREAM_HOSTNAMES, redirect_ports=()):
+        self.host = host
+        self.port = port
+        self.netloc = f"{host}:{port}"
+        self.base_url = f"http://{self.netloc}"
+        self.redirect_hostnames = frozenset(redirect_hostnames)
+        # Backends redirect to their own port, which is still the TorCOIN server
+        self.redirect_ports = frozenset(redirect_ports) | {port}
+        self.request_skip = HOP_BY_HOP_HEADERS | {'host'}
+        # Framing headers are regenerated when the body is forwarded
+        self.request_skip_with_body = self.request_skip | {'content-length'}
+        self.response_skip = HOP_BY_HOP_HEADERS
+
+    def resolve(self, path):
+        """Check a request target against the allow-list.
+
+        Returns (target_url, upstream_path), or None if the request must be
+        blocked. Absolute-form http(s) URLs and "//host:port/path" targets are
+        accepted only when they name exactly the allowed host and port.
+        """
+        try:
+            parts = urlsplit(path)
+            port = parts.port
+        except ValueError:
+            return None
+        if parts.netloc != self.netloc or parts.scheme not in ('http', 'https', '') or \
+           parts.hostname != self.host or port != self.port:
+            return None
+        upstream_path = parts.path or "/"
+        if parts.query:
+            upstream_path += "?" + parts.query
+        return self.base_url + upstream_path, upstream_path
+
+    def resolve_redirect(self, target_url, location):
+        """Resolve an upstream redirect that stays on the TorCOIN server, or None."""
+        try:
+            parts = urlsplit(urljoin(target_url, location))
+            port = parts.port or 80
+        except ValueError:
+            return None
+        if parts.hostname not in self.redirect_hostnames or port not in self.redirect_ports:
+            return None
+        upstream_path = parts.path or "/"
+        if parts.query:
+            upstream_path += "?" + parts.query
+        return self.base_url + upstream_path, upstream_path
+
+    def request_headers(self, items, with_body=False):
+        """Client headers to forward upstream, as a list of (name, value)."""
+        skip = self.request_skip_with_body if with_body else self.request_skip
+        return [(name, value) for name, value in items if name.lower() not in skip]
+
+    def response_headers(self, items):
+        """Upstream headers to relay to the client, as a list of (name, value)."""
+        skip = self.response_skip
+        return [(name, value) for name, value in items if name.lower() not in skip]
+
+POLICY = ProxyPolicy(ALLOWED_HOST, ALLOWED_PORT)
+
+class CircuitOpen(Exception):
+    """Every backend is failing; the request was not sent."""
+
+    def __init__(self, retry_after):
+        super().__init__("circuit open: TorCOIN server unavailable")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Fails fast while the upstream is down instead of queueing behind it.
+
+    After failure_threshold consecutive upstream failures the circuit
+    opens and requests are refused without touching the network. Once
+    reset_timeout has passed, one request is let through as a probe
+    (half-open): success closes the circuit, failure keeps it open for
+    another reset_timeout. Each backend has one, shared by both engines.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return 0 if a request may go upstream, else seconds until the next probe."""
+        if self.state == "closed":
+            return 0
+        with self._lock:
+            if self.state == "closed":
+                return 0
+            now = time.monotonic()
+            remaining = self._opened_at + self.reset_timeout - now
+            if remaining > 0:
+                return remaining
+            # Let this request probe; everyone else waits out another window
+            self.state = "half-open"
+            self._opened_at = now
+            return 0
+
+    def record_success(self):
+        if self.state == "closed" and not self.failures:
+            return
+        with self._lock:
+            if self.state != "closed":
+                ACCESS_LOG.log(f"🔌 CIRCUIT CLOSED: {self.name} is answering again",
+                               sample=False)
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or \
+               (self.state == "closed" and self.failures >= self.failure_threshold):
+                ACCESS_LOG.log(f"⚡ CIRCUIT OPEN: {self.name} after {self.failures} failures, "
+                               f"skipping it for {self.reset_timeout}s", sample=False)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+class UpstreamPool:
+    """Thread-safe pool of keep-alive HTTP connections to one backend."""
+
+    def __init__(self, host, port, max_idle=POOL_MAX_IDLE, idle_timeout=POOL_IDLE_TIMEOUT,
+                 connect_timeout=UPSTREAM_CONNECT_TIMEOUT, timeout=UPSTREAM_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self._idle = []  # (connection, last_used), most recently used last
+        self._lock = threading.Lock()
+
+    def _is_healthy(self, conn, last_used):
+        """An idle connection is usable if it is fresh and the server hasn't closed it."""
+        if conn.sock is None or time.monotonic() - last_used > self.idle_timeout:
+            return False
+        try:
+            # Readable while idle means EOF (server closed it) or unexpected data
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def acquire(self):
+        """Return (connection, reused): a healthy idle connection or a new one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            if self._is_healthy(conn, last_used):
+                return conn, True
+            conn.close()
+        return self.connect(), False
+
+    def connect(self):
+        """Open a new upstream connection, timing the TCP connect.
+
+        The short connect timeout only covers the handshake; reads then use
+        the longer read timeout.
+        """
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        started = time.perf_counter()
+        try:
+            conn.connect()
+            conn.sock.settimeout(self.timeout)
+        except BaseException:
+            conn.close()
+            raise
+        UPSTREAM_CONNECT_SECONDS.observe(time.perf_counter() - started)
+        return conn
+
+    def release(self, conn, response):
+        """Return a connection after its response has been fully read."""
+        if response.will_close or not response.isclosed() or conn.sock is None:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def send(self, conn, method, path, body, headers):
+        """Send one request and read the response head, timing the round trip."""
+        started = time.perf_counter()
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        UPSTREAM_RESPONSE_SECONDS.observe(time.perf_counter() - started)
+        return response
+
+class Backend:
+    """One allow-listed coin_server.py instance: its connections, breaker and load."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.name = f"{host}:{port}"
+        self.pool = UpstreamPool(host, port)
+        self.breaker = CircuitBreaker(self.name)
+        self.active = 0  # Requests in flight, for least-connections
+        self.healthy = True
+        self.check_failures = 0
+
+class UpstreamGroup:
+    """The backends behind ALLOWED_URL, with load balancing and active health checks.
+
+    choose() skips backends that failed their recent health checks or whose
+    circuit is open. If health checks have taken every backend out, all of
+    them are tried again, so a broken check can't black-hole the site; the
+    breakers still stop traffic to servers that are really down.
+    """
+
+    def __init__(self, backends, strategy=DEFAULT_BALANCE):
+        self.backends = list(backends)
+        self.strategy = strategy
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def choose(self, exclude=()):
+        """Return the backend for the next attempt and count it as active.
+
+        Backends in exclude (already tried for this request) are only used
+        when nothing else is left. Raises CircuitOpen if every candidate's
+        circuit is open.
+        """
+        candidates = [backend for backend in self.backends if backend not in exclude] or \
+            self.backends
+        candidates = [backend for backend in candidates if backend.healthy] or candidates
+        # Rotate the starting point so equally loaded backends take turns
+        start = next(self._turn)
+        ordered = [candidates[(start + index) % len(candidates)]
+                   for index in range(len(candidates))]
+        if self.strategy == "least-connections":
+            ordered.sort(key=lambda backend: backend.active)
+
+        retry_after = None
+        for backend in ordered:
+            wait = backend.breaker.allow()
+            if not wait:
+                with self._lock:
+                    backend.active += 1
+                return backend
+            retry_after = wait if retry_after is None else min(retry_after, wait)
+        raise CircuitOpen(retry_after)
+
+    def done(self, backend):
+        """An attempt on backend has finished (successfully or not)."""
+        with self._lock:
+            backend.active -= 1
+
+    def healthy_count(self):
+        return sum(backend.healthy for backend in self.backends)
+
+    def open_circuits(self):
+        return sum(backend.breaker.state != "closed" for backend in self.backends)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request to a backend (threaded engine), retrying what is safe to retry.
+
+        Returns (connection, response); hand both back with release() once
+        the body has been read. Raises CircuitOpen without sending anything
+        while every backend is considered down.
+        """
+        headers = headers or {}
+        # A streamed body has been consumed and cannot be sent again
+        replayable = body is None or isinstance(body, bytes)
+        # Failed connects never sent anything, so any method may retry them
+        # (on the next backend); a request that may have reached a server is
+        # only resent if idempotent
+        connect_retries = max(UPSTREAM_RETRIES, len(self.backends) - 1)
+        resends = UPSTREAM_RETRIES if method in IDEMPOTENT_METHODS and replayable else 0
+        backoff = RETRY_BACKOFF
+        tried = []
+        backend = None
+        fresh = False
+        while True:
+            if backend is None:
+                backend = self.choose(tried)
+                tried.append(backend)
+            try:
+                conn, reused = (backend.pool.connect(), False) if fresh else backend.pool.acquire()
+            except OSError:
+                self._failed(backend)
+                backend, fresh = None, False
+                if connect_retries <= 0:
+                    raise
+                connect_retries -= 1
+                UPSTREAM_RETRIES_TOTAL.inc("connect")
+                time.sleep(backoff)
+                backoff *= 2
+                continue
+
+            try:
+                response = backend.pool.send(conn, method, path, body, headers)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                conn.close()
+                if reused and replayable:
+                    # The server closed the pooled connection between requests; the
+                    # request never reached it, so sending it again is safe
+                    fresh = True
+                    continue
+                self._failed(backend)
+                if resends <= 0:
+                    raise
+                resends -= 1
+                UPSTREAM_RETRIES_TOTAL.inc("resend")
+                time.sleep(backoff)
+                backoff *= 2
+                backend, fresh = None, False
+                continue
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                self._failed(backend)
+                raise
+            except BaseException:
+                conn.close()
+                self.done(backend)
+                raise
+
+            backend.breaker.record_success()
+            UPSTREAM_REQUESTS.inc(backend.name)
+            conn.backend = backend
+            return conn, response
+
+    def _failed(self, backend):
+        backend.breaker.record_failure()
+        self.done(backend)
+
+    def release(self, conn, response):
+        """Return a connection from request() after its response has been fully read."""
+        self.done(conn.backend)
+        conn.backend.pool.release(conn, response)
+
+    def start_health_checks(self, interval=HEALTH_CHECK_INTERVAL):
+        """Probe every backend each interval seconds from a daemon thread."""
+        threading.Thread(target=self._health_check_loop, args=(interval,),
+                         name="health-check", daemon=True).start()
+
+    def _health_check_loop(self, interval):
+        while True:
+            for backend in self.backends:
+                self.check(backend)
+            time.sleep(interval)
+
+    def check(self, backend):
+        """HEAD HEALTH_CHECK_PATH on one backend and update its healthy flag."""
+        conn = http.client.HTTPConnection(backend.host, backend.port, timeout=HEALTH_CHECK_TIMEOUT)
+        try:
+            conn.request("HEAD", HEALTH_CHECK_PATH,
+                         headers={"User-Agent": "TorCOIN-Proxy/1.0 health-check"})
+            ok = conn.getresponse().status < 500
+        except (OSError, http.client.HTTPException):
+            ok = False
+        finally:
+            conn.close()
+
+        if ok:
+            backend.check_failures = 0
+            # The check is a real request, so it also serves as the breaker's probe
+            backend.breaker.record_success()
+            if not backend.healthy:
+                ACCESS_LOG.log(f"💚 BACKEND UP: {backend.name} passed its health check",
+                               sample=False)
+                backend.healthy = True
+            return
+        backend.check_failures += 1
+        if backend.healthy and backend.check_failures >= HEALTH_CHECK_FAILURES:
+            ACCESS_LOG.log(f"💔 BACKEND DOWN: {backend.name} failed {backend.check_failures} "
+                           f"health checks", sample=False)
+            backend.healthy = False
+
+UPSTREAMS = UpstreamGroup([Backend(ALLOWED_HOST, ALLOWED_PORT)])
+
+def parse_backend(value):
+    """argparse type for --upstream HOST:PORT; only backends on this machine are allowed."""
+    host, _, port = value.rpartition(":")
+    if host not in BACKEND_HOSTS or not port.isdigit() or not 0 < int(port) < 65536:
+        raise argparse.ArgumentTypeError(
+            f"expected HOST:PORT with HOST one of {', '.join(BACKEND_HOSTS)}")
+    return host, int(port)
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into {directive: argument}."""
+    directives = {}
+    for item in (value or "").split(","):
+        name, _, arg = item.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"')
+    return directives
+
+class CachedResponse:
+    """A complete upstream response stored in the proxy cache."""
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        # Cached bodies are always sent with an explicit length
+        self.headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+        self.headers.append(('Content-Length', str(len(body))))
+        self.body = body
+        self.size = len(body)
+        self.update_validators()
+
+    def update_validators(self):
+        """Re-read ETag/Last-Modified/freshness and restart the freshness clock."""
+        values = {k.lower(): v for k, v in self.headers}
+        self.etag = values.get('etag')
+        self.last_modified = values.get('last-modified')
+        directives = parse_cache_control(values.get('cache-control'))
+        try:
+            max_age = int(directives.get('s-maxage', directives.get('max-age', 0)))
+        except ValueError:
+            max_age = 0
+        # no-cache means "store, but revalidate before every use"
+        self.max_age = 0 if 'no-cache' in directives else max_age
+        self.validated_at = time.monotonic()
+
+    def is_fresh(self):
+        return time.monotonic() - self.validated_at < self.max_age
+
+    def refreshed(self, headers):
+        """A copy updated with the headers of a 304 revalidation response."""
+        updates = {k.lower(): (k, v) for k, v in POLICY.response_headers(headers)
+                   if k.lower() != 'content-length'}
+        merged = [updates.pop(k.lower(), (k, v)) for k, v in self.headers]
+        return CachedResponse(self.status, self.reason, merged + list(updates.values()),
+                              self.body)
+
+    def conditional_headers(self):
+        """Validators to send upstream when revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def not_modified_for(self, if_none_match, if_modified_since):
+        """Whether the client's own cached copy matches this entry."""
+        if if_none_match is not None:
+            if if_none_match.strip() == "*":
+                return True
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            tags = [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+            etag = self.etag[2:] if self.etag and self.etag.startswith("W/") else self.etag
+            return etag is not None and etag in tags
+        if if_modified_since and self.last_modified:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+                modified = email.utils.parsedate_to_datetime(self.last_modified)
+            except (TypeError, ValueError, IndexError):
+                return False
+            return since is not None and modified is not None and modified <= since
+        return False
+
+    def response_for(self, method, request_headers, cache_status):
+        """Return (status, reason, headers, body) answering a request from this entry."""
+        if self.not_modified_for(request_headers.get('if-none-match'),
+                                 request_headers.get('if-modified-since')):
+            headers = [(k, v) for k, v in self.headers
+                       if k.lower() in ('etag', 'last-modified', 'cache-control', 'vary',
+                                        'expires', 'content-location')]
+            return 304, 'Not Modified', headers + [('X-Cache', cache_status)], b''
+        body = b'' if method == 'HEAD' else self.body
+        return self.status, self.reason, self.headers + [('X-Cache', cache_status)], body
+
+class ResponseCache:
+    """Bounded LRU cache of upstream GET responses.
+
+    Entries are keyed on URL plus the request values of the headers named in
+    the response's Vary. Concurrent misses for one URL are coalesced: the
+    first caller fetches while the others wait for its result.
+    """
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_entry_bytes=CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (url, vary values) -> CachedResponse, oldest first
+        self._vary = {}  # url -> header names its responses vary on
+        self._url_keys = {}  # url -> set of keys in _entries
+        self._size = 0
+        self._inflight = {}  # url -> threading.Event
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Total body bytes currently cached."""
+        return self._size
+
+    @staticmethod
+    def request_is_cacheable(method, request_headers):
+        """Only plain GET/HEAD requests go through the cache."""
+        if method not in ('GET', 'HEAD'):
+            return False
+        if request_headers.get('range') or request_headers.get('authorization'):
+            return False
+        return 'no-store' not in parse_cache_control(request_headers.get('cache-control'))
+
+    @staticmethod
+    def wants_revalidation(request_headers):
+        """The client asked for an end-to-end revalidation (e.g. a hard reload)."""
+        directives = parse_cache_control(request_headers.get('cache-control'))
+        return 'no-cache' in directives or directives.get('max-age') == '0' or \
+            (request_headers.get('pragma') or '').lower() == 'no-cache'
+
+    @staticmethod
+    def _vary_values(names, request_headers):
+        return tuple(request_headers.get(name) or '' for name in names)
+
+    def lookup(self, url, request_headers, count=True):
+        """Return the cached entry matching the request, or None.
+
+        Pass count=False for a second look on behalf of the same client
+        request, so each request is one hit or one miss.
+        """
+        with self._lock:
+            names = self._vary.get(url)
+            entry = None
+            if names is not None:
+                key = (url, self._vary_values(names, request_headers))
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            if count and entry is None:
+                self.misses += 1
+            elif count:
+                self.hits += 1
+            return entry
+
+    def refresh(self, url, request_headers, entry, headers):
+        """Replace entry with a copy updated from a 304's headers; returns the copy.
+
+        Other threads may be sending the old entry, so it is never changed in place.
+        """
+        fresh = entry.refreshed(headers)
+        with self._lock:
+            names = self._vary.get(url)
+            if names is not None:
+                key = (url, self._vary_values(names, request_headers))
+                if self._entries.get(key) is entry:
+                    self._entries[key] = fresh
+        return fresh
+
+    def store(self, url, request_headers, status, reason, headers, body):
+        """Cache a complete response if it is cacheable; returns True if stored."""
+        if status != 200 or len(body) > self.max_entry_bytes:
+            return False
+        values = {k.lower(): v for k, v in headers}
+        directives = parse_cache_control(values.get('cache-control'))
+        if 'no-store' in directives or 'private' in directives or 'set-cookie' in values:
+            return False
+        vary = tuple(sorted(name.strip().lower()
+                            for name in values.get('vary', '').split(',') if name.strip()))
+        if '*' in vary:
+            return False
+
+        entry = CachedResponse(status, reason, headers, body)
+        if not entry.max_age and not entry.etag and not entry.last_modified:
+            # Nothing to revalidate with and no freshness lifetime: useless to keep
+            return False
+
+        with self._lock:
+            if self._vary.get(url) != vary:
+                # The upstream changed its Vary; older variants use stale keys
+                for key in self._url_keys.pop(url, ()):
+                    self._size -= self._entries.pop(key).size
+                self._vary[url] = vary
+            key = (url, self._vary_values(vary, request_headers))
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.size
+            self._entries[key] = entry
+            self._url_keys.setdefault(url, set()).add(key)
+            self._size += entry.size
+
+            while self._size > self.max_bytes:
+                old_key, old = self._entries.popitem(last=False)
+                self._size -= old.size
+                keys = self._url_keys[old_key[0]]
+                keys.discard(old_key)
+                if not keys:
+                    del self._url_keys[old_key[0]]
+                    del self._vary[old_key[0]]
+        return True
+
+    def begin_fetch(self, url):
+        """Claim the upstream fetch for url.
+
+        Returns True if the caller should fetch (and then call end_fetch).
+        Otherwise waits for the fetch already in flight and returns False.
+        """
+        with self._lock:
+            event = self._inflight.get(url)
+            if event is None:
+                self._inflight[url] = threading.Event()
+                return True
+        event.wait(UPSTREAM_TIMEOUT)
+        return False
+
+    def end_fetch(self, url):
+        with self._lock:
+            event = self._inflight.pop(url, None)
+        if event is not None:
+            event.set()
+
+RESPONSE_CACHE = ResponseCache()
+ACCESS_LOG = AccessLog("TorCOIN-Proxy")
+
+class ClientLimiter:
+    """Per-client-IP token buckets and connection counts.
+
+    State is split across shards, each a dict with its own lock, picked by
+    hashing the IP, so a check touches one small dict: O(1) and rarely
+    contended. A bucket left idle long enough to refill completely is
+    indistinguishable from a new one, so each shard lazily drops those
+    while it is being touched, at most once per sweep interval.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST,
+                 max_connections_per_ip=MAX_CONNECTIONS_PER_IP, shards=LIMITER_SHARDS,
+                 sweep_interval=LIMITER_SWEEP_INTERVAL):
+        self.rate = rate
+        self.burst = burst
+        self.max_connections_per_ip = max_connections_per_ip
+        self.sweep_interval = sweep_interval
+        # Per shard: {ip: [tokens, last_update]}, {ip: open connections}, lock, next sweep
+        self._shards = [({}, {}, threading.Lock(), [0.0]) for _ in range(shards)]
+
+    def _shard(self, ip):
+        return self._shards[hash(ip) % len(self._shards)]
+
+    def take(self, ip):
+        """Spend one token for a request from ip.
+
+        Returns 0 if the request may proceed, otherwise the seconds until a
+        token is available (for Retry-After).
+        """
+        if self.rate <= 0:
+            return 0
+        buckets, _, lock, next_sweep = self._shard(ip)
+        now = time.monotonic()
+        with lock:
+            if now >= next_sweep[0]:
+                self._sweep(buckets, now)
+                next_sweep[0] = now + self.sweep_interval
+            bucket = buckets.get(ip)
+            if bucket is None:
+                bucket = buckets[ip] = [float(self.burst), now]
+            else:
+                bucket[0] = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+    def _sweep(self, buckets, now):
+        full_after = self.burst / self.rate
+        for ip in [ip for ip, (_, updated) in buckets.items() if now - updated >= full_after]:
+            del buckets[ip]
+
+    def open_connection(self, ip):
+        """Count a new connection from ip; False if ip is already at its cap."""
+        _, connections, lock, _ = self._shard(ip)
+        with lock:
+            count = connections.get(ip, 0)
+            if self.max_connections_per_ip and count >= self.max_connections_per_ip:
+                return False
+            connections[ip] = count + 1
+            return True
+
+    def close_connection(self, ip):
+        _, connections, lock, _ = self._shard(ip)
+        with lock:
+            count = connections.get(ip, 0) - 1
+            if count > 0:
+                connections[ip] = count
+            else:
+                connections.pop(ip, None)
+
+    def tracked_clients(self):
+        return sum(len(buckets) for buckets, _, _, _ in self._shards)
+
+LIMITER = ClientLimiter()
+
+# Exposed on the local metrics port; see torcoin_metrics
+METRICS = MetricsRegistry()
+HTTP_METRICS = HTTPMetrics(METRICS, "torcoin_proxy")
+UPSTREAM_CONNECT_SECONDS = METRICS.histogram("torcoin_proxy_upstream_connect_seconds",
+                                             "Time to open a new upstream connection")
+UPSTREAM_RESPONSE_SECONDS = METRICS.histogram("torcoin_proxy_upstream_response_seconds",
+                                              "Time from sending a request upstream to its response head")
+METRICS.callback("torcoin_proxy_cache_hits_total", "Response cache lookups that found an entry",
+                 lambda: RESPONSE_CACHE.hits, kind="counter")
+METRICS.callback("torcoin_proxy_cache_misses_total", "Response cache lookups that found nothing",
+                 lambda: RESPONSE_CACHE.misses, kind="counter")
+METRICS.callback("torcoin_proxy_cache_hit_ratio", "Share of response cache lookups that hit",
+                 lambda: hit_ratio(RESPONSE_CACHE.hits, RESPONSE_CACHE.misses))
+METRICS.callback("torcoin_proxy_cache_bytes", "Body bytes held in the response cache",
+                 lambda: RESPONSE_CACHE.size)
+UPSTREAM_RETRIES_TOTAL = METRICS.counter("torcoin_proxy_upstream_retries_total",
+                                         "Upstream attempts repeated after a failure, by kind",
+                                         ("kind",))
+CIRCUIT_REJECTIONS = METRICS.counter("torcoin_proxy_circuit_rejections_total",
+                                     "Requests failed fast while every backend's circuit was open")
+UPSTREAM_REQUESTS = METRICS.counter("torcoin_proxy_upstream_requests_total",
+                                    "Requests answered by each backend", ("backend",))
+METRICS.callback("torcoin_proxy_open_circuits", "Backends whose circuit breaker is open",
+                 UPSTREAMS.open_circuits)
+METRICS.callback("torcoin_proxy_healthy_backends", "Backends passing their health checks",
+                 UPSTREAMS.healthy_count)
+REJECTED_CONNECTIONS = METRICS.counter("torcoin_proxy_rejected_connections_total",
+                                       "Client connections refused at accept time, by reason",
+                                       ("reason",))
+METRICS.callback("torcoin_proxy_rate_limited_clients", "Client IPs with a token bucket",
+                 LIMITER.tracked_clients)
+
+def error_body(status, message):
+    """Return (reason, HTML body) for an error response."""
+    reason = http.server.BaseHTTPRequestHandler.responses.get(status, ("Error",))[0]
+    return reason, (f"<html><body><h1>{status} {html.escape(reason)}</h1>"
+                    f"<p>{html.escape(message)}</p></body></html>").encode("utf-8")
+
+def error_page(status, message, headers=()):
+    """Return a complete HTML error response that closes the connection."""
+    reason, body = error_body(status, message)
+    lines = [f"HTTP/1.1 {status} {reason}",
+             "Content-Type: text/html; charset=utf-8",
+             f"Content-Length: {len(body)}",
+             "Connection: close"]
+    lines.extend(f"{header}: {value}" for header, value in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1") + body
+
+def retry_after_header(seconds):
+    return ('Retry-After', str(max(1, math.ceil(seconds))))
+
+class TorCOINProxyHandler(DrainingHandlerMixin, http.server.BaseHTTPRequestHandler):
     """Strict proxy handler that only allows TorCOIN access."""
 
-    def do_GET(self):
-        """Handle GET requests with strict filtering."""
+    # A client that stops sending mid-request only holds its thread this long
+    timeout = KEEPALIVE_TIMEOUT
+
+    # Set once the response status line has gone out; later errors can only drop the connection
+    response_started = False
+
+    # Per-request bookkeeping for HTTP_METRICS
+    response_status = None
+    body_bytes = 0
+
+    def setup(self):
+        super().setup()
+        HTTP_METRICS.active_connections.inc()
+
+    def finish(self):
         try:
-            # Parse the requested URL
-            parsed_url = urlparse(self.path)
+            super().finish()
+        finally:
+            HTTP_METRICS.active_connections.dec()
+
+    def handle_one_request(self):
+        """Handle one request and record its status, latency and body size."""
+        started = time.perf_counter()
+        self.response_started = False
+        self.response_status = None
+        self.body_bytes = 0
+        super().handle_one_request()
+        if self.response_status is not None:
+            HTTP_METRICS.observe_request(self.response_status, time.perf_counter() - started,
+                                         self.body_bytes)
+
+    def proxy_request(self):
+        """Forward a request of any method through the strict filter."""
+        try:
+            retry_after = LIMITER.take(self.client_address[0])
+            if retry_after:
+                self.log_message("⛔ RATE LIMITED %s: %s", self.command, self.path)
+                self.send_retry_later(429, "Too many requests, slow down", retry_after)
+                return
 
             # Strict filtering: ONLY allow requests to our TorCOIN server
-            if parsed_url.netloc != f"{ALLOWED_HOST}:{ALLOWED_PORT}" and \
-               not self.path.startswith(f"http://{ALLOWED_HOST}:{ALLOWED_PORT}"):
+            target = POLICY.resolve(self.path)
+            if target is None:
                 self.send_error(403, "Access Denied: Only TorCOIN server allowed")
-                self.log_message("🚫 BLOCKED: %s", self.path)
+                self.log_message("🚫 BLOCKED %s: %s", self.command, self.path)
                 return
+            target_url, upstream_path = target
 
-            # Reconstruct the target URL
-            if self.path.startswith("http"):
-                target_url = self.path
-            else:
-                target_url = urljoin(ALLOWED_URL, self.path)
-
-            # Verify it's still pointing to our server
-            target_parsed = urlparse(target_url)
-            if target_parsed.hostname != ALLOWED_HOST or target_parsed.port != ALLOWED_PORT:
-                self.send_error(403, "Access Denied: Invalid destination")
-                self.log_message("🚫 BLOCKED INVALID: %s", target_url)
+            # Forward the request to TorCOIN server (logged with its status by log_request)
+            try:
+                body, length = self.request_body()
+            except ValueError:
+                self.send_error(400, "Bad request body framing")
                 return
 
-            # Forward the request to TorCOIN server
-            self.log_message("✅ PROXYING: %s", target_url)
-
-            # Add timeout and headers
-            req = urllib.request.Request(target_url)
-            req.add_header('User-Agent', 'TorCOIN-Proxy/1.0')
-
-            # Copy original headers (except host)
-            for header, value in self.headers.items():
-                if header.lower() not in ['host', 'connection', 'keep-alive', 'proxy-authenticate',
-                                        'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
-                                        'upgrade']:
-                    req.add_header(header, value)
-
-            # Make the request with timeout
-            with urllib.request.urlopen(req, timeout=10) as response:
-                # Send response back to client
-                self.send_response(response.status)
-
-                # Copy response headers
-                for header, value in response.headers.items():
-                    if header.lower() not in ['connection', 'keep-alive', 'proxy-authenticate',
-                                            'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
-                                            'upgrade', 'content-encoding']:
-                        self.send_header(header, value)
-
-                self.end_headers()
-
-                # Stream the response body
-                while True:
-                    data = response.read(8192)
-                    if not data:
-                        break
-                    self.wfile.write(data)
-
-        except urllib.error.HTTPError as e:
-            self.send_error(e.code, f"Upstream error: {e.reason}")
-            self.log_message("❌ UPSTREAM ERROR: %s", e)
-        except urllib.error.URLError as e:
-            self.send_error(502, f"Connection error: {e.reason}")
-            self.log_message("❌ CONNECTION ERROR: %s", e)
+            # Copy original headers (except host, hop-by-hop and body framing)
+            headers = {'User-Agent': 'TorCOIN-Proxy/1.0'}
+            headers.update(POLICY.request_headers(self.headers.items(), with_body=True))
+            if length is not None:
+                headers['Content-Length'] = str(length)
+
+            self.forward_to_upstream(self.command, target_url, upstream_path, body, headers)
+
+        except CircuitOpen as e:
+            CIRCUIT_REJECTIONS.inc()
+            self.log_message("⚡ UPSTREAM DOWN, failing fast %s: %s", self.command, self.path)
+            if self.response_started:
+                self.close_connection = True
+            else:
+                self.send_retry_later(503, "TorCOIN server unavailable, try again shortly",
+                                      e.retry_after)
         except socket.timeout:
-            self.send_error(504, "Gateway timeout")
+            self.fail(504, "Gateway timeout")
             self.log_message("⏰ TIMEOUT: Request timed out")
+        except (OSError, http.client.HTTPException) as e:
+            self.fail(502, f"Connection error: {e}")
+            self.log_message("❌ CONNECTION ERROR: %s", e)
         except Exception as e:
-            self.send_error(500, f"Proxy error: {str(e)}")
+            self.fail(500, f"Proxy error: {str(e)}")
             self.log_message("💥 PROXY ERROR: %s", e)
 
-    def do_POST(self):
-        """Handle POST requests (same strict filtering)."""
-        # For simplicity, treat POST like GET with body forwarding
-        try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length) if content_length > 0 else b''
+    do_GET = do_HEAD = do_POST = do_PUT = do_DELETE = do_OPTIONS = do_PATCH = proxy_request
 
-            # Use the same filtering logic as GET
-            parsed_url = urlparse(self.path)
+    def send_retry_later(self, status, message, retry_after):
+        """Answer 429/503 with Retry-After and close the connection."""
+        _, body = error_body(status, message)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header(*retry_after_header(retry_after))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
 
-            if parsed_url.netloc != f"{ALLOWED_HOST}:{ALLOWED_PORT}" and \
-               not self.path.startswith(f"http://{ALLOWED_HOST}:{ALLOWED_PORT}"):
-                self.send_error(403, "Access Denied: Only TorCOIN server allowed")
-                self.log_message("🚫 BLOCKED POST: %s", self.path)
+    def fail(self, code, message):
+        """Send an error page, or just drop the connection if a response is already streaming."""
+        if self.response_started:
+            self.close_connection = True
+        else:
+            self.send_error(code, message)
+
+    def request_body(self):
+        """Return (body, length) for streaming the client's body upstream.
+
+        body is None when there is none. A chunked body is returned with
+        length None, so http.client re-chunks it on the way upstream.
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            return self.iter_chunked_body(), None
+        length = int(self.headers.get('Content-Length') or 0)
+        if length < 0:
+            raise ValueError("negative Content-Length")
+        if length == 0:
+            return None, None
+        return self.iter_body(length), length
+
+    def iter_body(self, length):
+        """Yield exactly length bytes of the request body in STREAM_CHUNK pieces."""
+        while length > 0:
+            data = self.rfile.read(min(length, STREAM_CHUNK))
+            if not data:
+                raise ConnectionError("client closed the connection mid-body")
+            length -= len(data)
+            yield data
+
+    def iter_chunked_body(self):
+        """Yield the de-chunked pieces of a chunked request body."""
+        while True:
+            size_line = self.rfile.readline(65537)
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip the trailer section
+                while self.rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+                    pass
                 return
+            yield from self.iter_body(size)
+            self.rfile.readline(65537)
 
-            if self.path.startswith("http"):
-                target_url = self.path
-            else:
-                target_url = urljoin(ALLOWED_URL, self.path)
+    def forward_to_upstream(self, method, target_url, upstream_path, body, headers):
+        """Answer from the response cache when possible, otherwise relay from upstream."""
+        if body is not None or not ResponseCache.request_is_cacheable(method, self.headers):
+            conn, response = self.fetch_upstream(method, target_url, upstream_path, body, headers)
+            try:
+                self.relay_response(response)
+            finally:
+                UPSTREAMS.release(conn, response)
+            return
+
+        # Client validators are answered from the cache, not forwarded
+        headers = {k: v for k, v in headers.items()
+                   if k.lower() not in ('if-none-match', 'if-modified-since')}
 
-            target_parsed = urlparse(target_url)
-            if target_parsed.hostname != ALLOWED_HOST or target_parsed.port != ALLOWED_PORT:
-                self.send_error(403, "Access Denied: Invalid destination")
-                self.log_message("🚫 BLOCKED INVALID POST: %s", target_url)
+        entry = RESPONSE_CACHE.lookup(target_url, self.headers)
+        if entry is not None and entry.is_fresh() and \
+           not ResponseCache.wants_revalidation(self.headers):
+            self.send_cached_response(entry, 'HIT')
+            return
+
+        if method != 'GET':
+            # HEAD is only answered from fresh entries; otherwise it goes upstream as-is
+            conn, response = self.fetch_upstream(method, target_url, upstream_path, body, headers)
+            try:
+                self.relay_response(response)
+            finally:
+                UPSTREAMS.release(conn, response)
+            return
+
+        started = time.monotonic()
+        leader = RESPONSE_CACHE.begin_fetch(target_url)
+        if not leader:
+            # Another request just fetched this URL; its result is as fresh as ours would be
+            entry = RESPONSE_CACHE.lookup(target_url, self.headers, count=False)
+            if entry is not None and entry.validated_at >= started:
+                self.send_cached_response(entry, 'HIT')
                 return
 
-            self.log_message("✅ PROXYING POST: %s", target_url)
+        try:
+            if entry is not None:
+                headers.update(entry.conditional_headers())
+            conn, response = self.fetch_upstream('GET', target_url, upstream_path, None, headers)
+            try:
+                if response.status == 304 and entry is not None:
+                    response.read()
+                    entry = RESPONSE_CACHE.refresh(target_url, self.headers, entry,
+                                                   response.getheaders())
+                    self.send_cached_response(entry, 'REVALIDATED')
+                    return
+                self.relay_response(response, cache_url=target_url)
+            finally:
+                UPSTREAMS.release(conn, response)
+        finally:
+            if leader:
+                RESPONSE_CACHE.end_fetch(target_url)
+
+    def fetch_upstream(self, method, target_url, upstream_path, body, headers):
+        """Send the request over a pooled upstream connection.
 
-            req = urllib.request.Request(target_url, data=post_data, method='POST')
-            req.add_header('User-Agent', 'TorCOIN-Proxy/1.0')
+        Redirects that stay on the TorCOIN server are followed. Returns
+        (connection, response); release both with UPSTREAMS.release().
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            conn, response = UPSTREAMS.request(method, upstream_path, body, headers)
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location and method == 'GET':
+                # Follow redirects that stay on the TorCOIN server
+                redirect = POLICY.resolve_redirect(target_url, location)
+                if redirect is not None:
+                    response.read()
+                    UPSTREAMS.release(conn, response)
+                    target_url, upstream_path = redirect
+                    continue
+            return conn, response
 
-            for header, value in self.headers.items():
-                if header.lower() not in ['host', 'connection', 'keep-alive', 'proxy-authenticate',
-                                        'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
-                                        'upgrade', 'content-length']:
-                    req.add_header(header, value)
+        UPSTREAMS.release(conn, response)
+        raise http.client.HTTPException("Too many upstream redirects")
 
-            with urllib.request.urlopen(req, timeout=10) as response:
-                self.send_response(response.status)
+    def relay_response(self, response, cache_url=None):
+        """Stream an upstream response to the client, caching it if cache_url is set."""
+        # Send response back to client
+        self.send_response(response.status)
+        self.response_started = True
 
-                for header, value in response.headers.items():
-                    if header.lower() not in ['connection', 'keep-alive', 'proxy-authenticate',
-                                            'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
-                                            'upgrade', 'content-encoding']:
-                        self.send_header(header, value)
+        # Copy response headers
+        headers = POLICY.response_headers(response.getheaders())
+        for header, value in headers:
+            self.send_header(header, value)
+        if cache_url is not None:
+            self.send_header('X-Cache', 'MISS')
 
-                self.end_headers()
+        self.end_headers()
 
-                while True:
-                    data = response.read(8192)
-                    if not data:
-                        break
-                    self.wfile.write(data)
+        # Stream the response body, keeping a copy while it still fits in the cache
+        collected = [] if cache_url is not None and response.status == 200 else None
+        collected_size = 0
+        while True:
+            data = response.read(8192)
+            if not data:
+                break
+            self.wfile.write(data)
+            self.body_bytes += len(data)
+            if collected is not None:
+                collected_size += len(data)
+                if collected_size > RESPONSE_CACHE.max_entry_bytes:
+                    collected = None
+                else:
+                    collected.append(data)
 
-        except Exception as e:
-            self.send_error(500, f"Proxy error: {str(e)}")
-            self.log_message("💥 PROXY POST ERROR: %s", e)
+        if collected is not None:
+            RESPONSE_CACHE.store(cache_url, self.headers, response.status, response.reason,
+                                 headers, b"".join(collected))
+
+    def send_cached_response(self, entry, cache_status):
+        """Answer the client from a cached entry (304 if its own copy is current)."""
+        status, reason, headers, body = entry.response_for(self.command, self.headers,
+                                                           cache_status)
+        self.send_response(status, reason)
+        self.response_started = True
+        for header, value in headers:
+            self.send_header(header, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+            self.body_bytes += len(body)
+
+    def log_request(self, code='-', size='-'):
+        """Queue one sampled access record per proxied response."""
+        if isinstance(code, http.HTTPStatus):
+            code = code.value
+        self.response_status = code
+        ACCESS_LOG.log(f"✅ PROXYING {self.command}: {self.path} -> {code}",
+                       client=self.client_address[0], method=self.command,
+                       url=self.path, status=code)
 
     def log_message(self, format, *args):
-        """Override logging with custom format."""
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[{timestamp}] TorCOIN-Proxy: {format % args}")
+        """Security events and errors are never sampled out."""
+        ACCESS_LOG.log(format % args, sample=False, client=self.client_address[0])
+
+def parse_http_head(head):
+    """Split a request/status line and headers out of a raw HTTP head.
+
+    Raises ValueError for a malformed head, including a Content-Length
+    that is not a single non-negative integer, so the body framing can
+    be trusted from here on.
+    """
+    lines = head.decode("iso-8859-1").split("\r\n")
+    start_line = lines[0].split(" ", 2)
+    headers = []
+    lengths = set()
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(":")
+        if not sep:
+            raise ValueError(f"Malformed header line: {line!r}")
+        name, value = name.strip(), value.strip()
+        if name.lower() == "content-length":
+            if not (value.isascii() and value.isdigit()):
+                raise ValueError(f"Invalid Content-Length: {value!r}")
+            lengths.add(int(value))
+        headers.append((name, value))
+    if len(lengths) > 1:
+        raise ValueError("Conflicting Content-Length headers")
+    return start_line, headers
+
+def header_value(headers, name):
+    """Return the first value of header name (case-insensitive), or None."""
+    name = name.lower()
+    for header, value in headers:
+        if header.lower() == name:
+            return value
+    return None
+
+class UpstreamClosed(Exception):
+    """The upstream closed a pooled connection before answering."""
+
+class CountingWriter:
+    """StreamWriter wrapper that counts the bytes written."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.size = 0
+
+    def write(self, data):
+        self.writer.write(data)
+        self.size += len(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+class TeeWriter(CountingWriter):
+    """CountingWriter that also keeps a copy of everything written."""
+
+    def __init__(self, writer):
+        super().__init__(writer)
+        self.chunks = []
+
+    def write(self, data):
+        super().write(data)
+        self.chunks.append(data)
+
+class AsyncTorCOINProxy:
+    """asyncio proxy engine.
+
+    Every client connection is a task instead of an OS thread, so thousands
+    of idle keep-alive clients cost only memory. Request and response bodies
+    are streamed in STREAM_CHUNK pieces, awaiting drain() after each write so
+    a slow reader on either side applies backpressure instead of buffering.
+    """
+
+    draining = False
+    drain_timeout = DRAIN_TIMEOUT
+
+    def __init__(self, server_address, max_idle_upstream=POOL_MAX_IDLE, backlog=BACKLOG,
+                 max_connections=MAX_CONNECTIONS, listen_socket=None):
+        self.server_address = server_address
+        self.max_idle_upstream = max_idle_upstream
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.listen_socket = listen_socket
+        self._loop = None
+        self._stopped = None
+        self._idle_upstream = {}  # backend -> [(reader, writer, last_used)]
+        self._upstream_backends = {}  # upstream writer -> the backend it is connected to
+        self._inflight = {}  # url -> asyncio.Event for coalesced cache fills
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        """Run the event loop until shutdown() is called."""
+        asyncio.run(self._serve())
+
+    def shutdown(self):
+        """Stop serve_forever() from another thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def server_close(self):
+        pass
+
+    def fileno(self):
+        """The listening socket's file descriptor (for SIGHUP handoff)."""
+        return self._listen_fd
+
+    def log_message(self, format, *args):
+        """Same log pipeline as TorCOINProxyHandler."""
+        ACCESS_LOG.log(format % args, sample=False)
+
+    def log_access(self, writer, method, url, status):
+        """Queue one sampled access record, matching TorCOINProxyHandler.log_request."""
+        peer = writer.get_extra_info("peername")
+        ACCESS_LOG.log(f"✅ PROXYING {method}: {url} -> {status}",
+                       client=peer[0] if peer else None, method=method, url=url,
+                       status=status)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._connections = {}
+        self._idle = set()  # Client connection tasks waiting for their next request
+        # Status and body size of the last response on each client connection,
+        # for the access log and HTTP_METRICS
+        self._statuses = {}
+        self._body_bytes = {}
+        if self.listen_socket is not None:
+            server = await asyncio.start_server(self._handle_client, sock=self.listen_socket,
+                                                backlog=self.backlog)
+        else:
+            host, port = self.server_address
+            server = await asyncio.start_server(self._handle_client, host or None, port,
+                                                backlog=self.backlog)
+        self.server_address = server.sockets[0].getsockname()[:2]
+        self._listen_fd = server.sockets[0].fileno()
+        async with server:
+            await self._stopped.wait()
+
+            # Stop accepting and let in-flight requests finish, then close pooled upstreams
+            self.draining = True
+            server.close()
+            await drain_connections(self._connections, self._idle, self.drain_timeout)
+            for idle in self._idle_upstream.values():
+                for _, writer, _ in idle:
+                    writer.close()
+            self._idle_upstream.clear()
+
+    async def _handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        ip = peer[0] if peer else ""
+        if len(self._connections) >= self.max_connections:
+            return await self._reject_connection(writer, 503, "overloaded",
+                                                 "Proxy is at capacity, try again shortly",
+                                                 OVERLOAD_RETRY_AFTER)
+        if not LIMITER.open_connection(ip):
+            return await self._reject_connection(writer, 429, "per_ip",
+                                                 "Too many connections from your address",
+                                                 OVERLOAD_RETRY_AFTER)
+
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        HTTP_METRICS.active_connections.inc()
+        try:
+            while await self._handle_one_request(reader, writer) and not self.draining:
+                pass
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            LIMITER.close_connection(ip)
+            HTTP_METRICS.active_connections.dec()
+            writer.close()
+            self._connections.pop(task, None)
+            self._idle.discard(task)
+            self._statuses.pop(writer, None)
+            self._body_bytes.pop(writer, None)
+
+    async def _handle_one_request(self, reader, writer):
+        """Proxy one request; returns True if the client connection stays open."""
+        # The connection counts as idle (closed at once when draining) until its first byte
+        task = asyncio.current_task()
+        self._idle.add(task)
+        try:
+            head = await asyncio.wait_for(reader.readexactly(1), KEEPALIVE_TIMEOUT)
+        except asyncio.IncompleteReadError:
+            return False
+        finally:
+            self._idle.discard(task)
+        try:
+            head += await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return False
+
+        started = time.perf_counter()
+        self._statuses[writer] = None
+        self._body_bytes[writer] = 0
+        try:
+            return await self._route_request(head, reader, writer)
+        finally:
+            status = self._statuses.get(writer)
+            if status is not None:
+                HTTP_METRICS.observe_request(status, time.perf_counter() - started,
+                                             self._body_bytes.get(writer, 0))
+
+    async def _reject_connection(self, writer, status, reason, message, retry_after):
+        """Refuse a connection over a cap without reading its request."""
+        REJECTED_CONNECTIONS.inc(reason)
+        try:
+            writer.write(error_page(status, message, [retry_after_header(retry_after)]))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _route_request(self, head, reader, writer):
+        """Check one request against the policy and proxy it if allowed."""
+        try:
+            (method, target, version), headers = parse_http_head(head)
+        except ValueError:
+            return await self._send_error(writer, 400, "Bad request")
+
+        peer = writer.get_extra_info("peername")
+        retry_after = LIMITER.take(peer[0] if peer else "")
+        if retry_after:
+            self.log_message("⛔ RATE LIMITED %s: %s", method, target)
+            return await self._send_error(writer, 429, "Too many requests, slow down",
+                                          [retry_after_header(retry_after)])
+
+        connection = (header_value(headers, "Connection") or "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = "close" not in connection
+        else:
+            keep_alive = "keep-alive" in connection
+        if self.draining:
+            keep_alive = False
+
+        resolved = POLICY.resolve(target)
+        if resolved is None:
+            self.log_message("🚫 BLOCKED %s: %s", method, target)
+            return await self._send_error(writer, 403, "Access Denied: Only TorCOIN server allowed")
+        target_url, upstream_path = resolved
+
+        try:
+            return await self._proxy_one_request(method, target_url, upstream_path, version,
+                                                 keep_alive, headers, reader, writer)
+        finally:
+            self.log_access(writer, method, target_url, self._statuses.get(writer) or "-")
+
+    async def _proxy_one_request(self, method, target_url, upstream_path, version, keep_alive,
+                                 headers, reader, writer):
+        """Answer an allowed request from the cache or the TorCOIN server."""
+        request_headers = {k.lower(): v for k, v in headers}
+        has_body = "transfer-encoding" in request_headers or \
+            int(request_headers.get("content-length") or 0) > 0
+        if not has_body and ResponseCache.request_is_cacheable(method, request_headers):
+            entry = RESPONSE_CACHE.lookup(target_url, request_headers)
+            if entry is not None and entry.is_fresh() and \
+               not ResponseCache.wants_revalidation(request_headers):
+                return await self._send_cached(writer, entry, method, request_headers,
+                                               keep_alive, 'HIT')
+            if method == "GET":
+                return await self._fetch_into_cache(target_url, upstream_path, version, keep_alive,
+                                                    headers, request_headers, entry, reader, writer)
+
+        upstream = await self._open_exchange(method, target_url, upstream_path, headers,
+                                             reader, writer)
+        if upstream is None:
+            return False
+
+        # From here on the response is streaming; errors just drop the connection
+        return await self._relay_response(method, version, keep_alive, upstream, writer)
+
+    async def _open_exchange(self, method, target_url, upstream_path, headers, reader, writer):
+        """Send the request upstream; on failure answer 502/503/504 and return None."""
+        try:
+            return await self._send_upstream_request(method, target_url, upstream_path,
+                                                     headers, reader)
+        except CircuitOpen as e:
+            CIRCUIT_REJECTIONS.inc()
+            self.log_message("⚡ UPSTREAM DOWN, failing fast %s: %s", method, target_url)
+            await self._send_error(writer, 503, "TorCOIN server unavailable, try again shortly",
+                                   [retry_after_header(e.retry_after)])
+        except asyncio.TimeoutError:
+            self.log_message("⏰ TIMEOUT: Request timed out")
+            await self._send_error(writer, 504, "Gateway timeout")
+        except (OSError, ValueError, UpstreamClosed, asyncio.IncompleteReadError) as e:
+            self.log_message("❌ CONNECTION ERROR: %s", e)
+            await self._send_error(writer, 502, f"Connection error: {e}")
+        return None
+
+    async def _fetch_into_cache(self, target_url, upstream_path, version, keep_alive, headers,
+                                request_headers, entry, reader, writer):
+        """Fetch or revalidate a cacheable GET, coalescing concurrent misses for one URL."""
+        started = time.monotonic()
+        event = self._inflight.get(target_url)
+        leader = event is None
+        if leader:
+            event = self._inflight[target_url] = asyncio.Event()
+        else:
+            try:
+                await asyncio.wait_for(event.wait(), UPSTREAM_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            # Another request just fetched this URL; its result is as fresh as ours would be
+            entry = RESPONSE_CACHE.lookup(target_url, request_headers, count=False)
+            if entry is not None and entry.validated_at >= started:
+                return await self._send_cached(writer, entry, "GET", request_headers,
+                                               keep_alive, 'HIT')
+
+        try:
+            # Client validators are answered from the cache, not forwarded
+            fetch_headers = [(k, v) for k, v in headers
+                             if k.lower() not in ('if-none-match', 'if-modified-since')]
+            if entry is not None:
+                fetch_headers.extend(entry.conditional_headers().items())
+
+            upstream = await self._open_exchange("GET", target_url, upstream_path, fetch_headers,
+                                                 reader, writer)
+            if upstream is None:
+                return False
+
+            up_reader, up_writer, status_line, response_headers = upstream
+            if status_line[1] == "304" and entry is not None:
+                self._release_upstream(up_reader, up_writer, "close" not in
+                                       (header_value(response_headers, "Connection") or "").lower())
+                entry = RESPONSE_CACHE.refresh(target_url, request_headers, entry,
+                                               response_headers)
+                return await self._send_cached(writer, entry, "GET", request_headers,
+                                               keep_alive, 'REVALIDATED')
+            return await self._relay_response("GET", version, keep_alive, upstream, writer,
+                                              cache_url=target_url,
+                                              request_headers=request_headers)
+        finally:
+            if leader:
+                self._inflight.pop(target_url, None)
+                event.set()
+
+    async def _send_cached(self, writer, entry, method, request_headers, keep_alive, cache_status):
+        """Answer the client from a cached entry."""
+        status, reason, headers, body = entry.response_for(method, request_headers, cache_status)
+        self._statuses[writer] = status
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        lines.extend(f"{header}: {value}" for header, value in headers)
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1") + body)
+        self._body_bytes[writer] = len(body)
+        await writer.drain()
+        return keep_alive
+
+    async def _send_upstream_request(self, method, target_url, upstream_path, headers,
+                                     client_reader):
+        """Send the request upstream, following redirects that stay on the TorCOIN server.
+
+        Returns (upstream_reader, upstream_writer, status_line, response_headers).
+        """
+        content_length = header_value(headers, "Content-Length")
+        chunked = "chunked" in (header_value(headers, "Transfer-Encoding") or "").lower()
+        has_body = chunked or (content_length is not None and int(content_length) > 0)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        forwarded = [f"{header}: {value}"
+                     for header, value in POLICY.request_headers(headers, with_body=True)]
+        if header_value(headers, "User-Agent") is None:
+            forwarded.insert(0, "User-Agent: TorCOIN-Proxy/1.0")
+
+        for _ in range(MAX_REDIRECTS + 1):
+            lines = [f"{method} {upstream_path} HTTP/1.1", f"Host: {POLICY.netloc}"]
+            lines.extend(forwarded)
+            if chunked:
+                lines.append("Transfer-Encoding: chunked")
+            elif content_length is not None:
+                lines.append(f"Content-Length: {int(content_length)}")
+            request_head = ("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1")
+
+            up_reader, up_writer, status_line, response_headers = \
+                await self._exchange(request_head, has_body, chunked, content_length, client_reader,
+                                     idempotent)
+
+            location = header_value(response_headers, "Location")
+            if method == "GET" and not has_body and location and \
+               status_line[1] in ("301", "302", "303", "307", "308"):
+                redirect = POLICY.resolve_redirect(target_url, location)
+                if redirect is not None:
+                    # Read and drop the redirect body, then ask for the new location
+                    reusable = await self._copy_body(method, status_line, response_headers,
+                                                     up_reader, None, dechunk=True)
+                    self._release_upstream(up_reader, up_writer, reusable)
+                    target_url, upstream_path = redirect
+                    continue
+            return up_reader, up_writer, status_line, response_headers
+
+        raise ValueError("Too many upstream redirects")
+
+    async def _exchange(self, request_head, has_body, chunked, content_length, client_reader,
+                        idempotent=False):
+        """Write the request and read the response head, retrying what is safe to retry.
+
+        A pooled connection that went stale is replaced for free. A bodiless
+        idempotent request is also resent (possibly to another backend) up to
+        UPSTREAM_RETRIES times if a fresh connection drops before answering.
+        A streamed body has been consumed and is never resent.
+        """
+        resends = UPSTREAM_RETRIES if idempotent and not has_body else 0
+        backoff = RETRY_BACKOFF
+        while True:
+            up_reader, up_writer, reused = await self._open_upstream()
+            backend = self._upstream_backends[up_writer]
+            try:
+                upstream = await self._send_and_read_head(up_reader, up_writer, request_head,
+                                                          has_body, chunked, content_length,
+                                                          client_reader)
+            except (UpstreamClosed, ConnectionResetError, BrokenPipeError):
+                self._release_upstream(up_reader, up_writer, False)
+                if not reused:
+                    backend.breaker.record_failure()
+                if has_body:
+                    raise
+                if not reused:
+                    if resends <= 0:
+                        raise
+                    resends -= 1
+                    UPSTREAM_RETRIES_TOTAL.inc("resend")
+                    await asyncio.sleep(backoff)
+                    backoff *= 2
+                continue
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                self._release_upstream(up_reader, up_writer, False)
+                backend.breaker.record_failure()
+                raise
+            except BaseException:
+                self._release_upstream(up_reader, up_writer, False)
+                raise
+            backend.breaker.record_success()
+            UPSTREAM_REQUESTS.inc(backend.name)
+            return upstream
+
+    async def _send_and_read_head(self, up_reader, up_writer, request_head, has_body, chunked,
+                                  content_length, client_reader):
+        """Write the request (streaming any body) on one connection and read the response head."""
+        started = time.perf_counter()
+        up_writer.write(request_head)
+        await up_writer.drain()
+        if chunked:
+            await copy_chunked(client_reader, up_writer, KEEPALIVE_TIMEOUT)
+        elif has_body:
+            await copy_exact(client_reader, up_writer, int(content_length), KEEPALIVE_TIMEOUT)
+
+        while True:
+            try:
+                head = await asyncio.wait_for(up_reader.readuntil(b"\r\n\r\n"),
+                                              UPSTREAM_TIMEOUT)
+            except asyncio.IncompleteReadError as e:
+                if not e.partial:
+                    raise UpstreamClosed("upstream closed the connection") from None
+                raise
+            status_line, response_headers = parse_http_head(head)
+            # Skip interim responses such as 100 Continue
+            if not status_line[1].startswith("1") or status_line[1] == "101":
+                UPSTREAM_RESPONSE_SECONDS.observe(time.perf_counter() - started)
+                return up_reader, up_writer, status_line, response_headers
+
+    async def _relay_response(self, method, version, keep_alive, upstream, writer,
+                              cache_url=None, request_headers=None):
+        """Stream the upstream response to the client, caching it if cache_url is set."""
+        up_reader, up_writer, status_line, response_headers = upstream
+        reusable = False
+        try:
+            status = status_line[1]
+            reason = status_line[2] if len(status_line) > 2 else ""
+            no_body = method == "HEAD" or status in ("204", "304")
+            chunked = "chunked" in (header_value(response_headers, "Transfer-Encoding") or "").lower()
+            has_length = header_value(response_headers, "Content-Length") is not None
+
+            # HTTP/1.0 clients can't take chunked bodies; those are de-chunked and closed
+            dechunk = chunked and version != "HTTP/1.1"
+            if not no_body and (dechunk or (not chunked and not has_length)):
+                keep_alive = False
+
+            relayed_headers = POLICY.response_headers(response_headers)
+            self._statuses[writer] = status
+            lines = [f"HTTP/1.1 {status} {reason}"]
+            lines.extend(f"{header}: {value}" for header, value in relayed_headers)
+            if chunked and not dechunk and not no_body:
+                lines.append("Transfer-Encoding: chunked")
+            if cache_url is not None:
+                lines.append("X-Cache: MISS")
+            lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1"))
+            await writer.drain()
+
+            # Only Content-Length bodies are cached here; chunked ones are just streamed
+            tee = None
+            if cache_url is not None and status == "200" and not chunked and has_length and \
+               int(header_value(response_headers, "Content-Length")) <= RESPONSE_CACHE.max_entry_bytes:
+                tee = counter = TeeWriter(writer)
+            else:
+                counter = CountingWriter(writer)
+
+            reusable = await self._copy_body(method, status_line, response_headers,
+                                             up_reader, counter, dechunk=dechunk)
+            self._body_bytes[writer] = counter.size
+            if tee is not None:
+                RESPONSE_CACHE.store(cache_url, request_headers, int(status), reason,
+                                     relayed_headers, b"".join(tee.chunks))
+            return keep_alive
+        finally:
+            self._release_upstream(up_reader, up_writer, reusable)
+
+    async def _copy_body(self, method, status_line, response_headers, up_reader, writer, dechunk):
+        """Copy a response body (or discard it when writer is None).
+
+        Returns True if the upstream connection can be reused afterwards.
+        """
+        if method == "HEAD" or status_line[1] in ("204", "304"):
+            return True
+        reusable = "close" not in (header_value(response_headers, "Connection") or "").lower() \
+            and status_line[0] == "HTTP/1.1"
+
+        if "chunked" in (header_value(response_headers, "Transfer-Encoding") or "").lower():
+            await copy_chunked(up_reader, writer, UPSTREAM_TIMEOUT, dechunk=dechunk)
+            return reusable
+        content_length = header_value(response_headers, "Content-Length")
+        if content_length is not None:
+            await copy_exact(up_reader, writer, int(content_length), UPSTREAM_TIMEOUT)
+            return reusable
+
+        # Body delimited by the upstream closing the connection
+        while True:
+            data = await asyncio.wait_for(up_reader.read(STREAM_CHUNK), UPSTREAM_TIMEOUT)
+            if not data:
+                return False
+            if writer is not None:
+                writer.write(data)
+                await writer.drain()
+
+    async def _open_upstream(self):
+        """Pick a backend and return (reader, writer, reused) from its idle pool or a new connection.
+
+        Nothing has been sent when a connect fails, so it is retried (on
+        the next backend) for any method.
+        """
+        connect_retries = max(UPSTREAM_RETRIES, len(UPSTREAMS.backends) - 1)
+        backoff = RETRY_BACKOFF
+        tried = []
+        while True:
+            backend = UPSTREAMS.choose(tried)
+            tried.append(backend)
+            idle = self._idle_upstream.get(backend, ())
+            while idle:
+                reader, writer, last_used = idle.pop()
+                if time.monotonic() - last_used <= POOL_IDLE_TIMEOUT and \
+                   not reader.at_eof() and not writer.is_closing():
+                    self._upstream_backends[writer] = backend
+                    return reader, writer, True
+                writer.close()
+            try:
+                reader, writer = await self._connect_upstream(backend)
+            except (OSError, asyncio.TimeoutError):
+                backend.breaker.record_failure()
+                UPSTREAMS.done(backend)
+                if connect_retries <= 0:
+                    raise
+                connect_retries -= 1
+                UPSTREAM_RETRIES_TOTAL.inc("connect")
+                await asyncio.sleep(backoff)
+                backoff *= 2
+                continue
+            self._upstream_backends[writer] = backend
+            return reader, writer, False
+
+    async def _connect_upstream(self, backend):
+        """Open a new connection to backend, timing the TCP connect."""
+        started = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(backend.host, backend.port), UPSTREAM_CONNECT_TIMEOUT)
+        UPSTREAM_CONNECT_SECONDS.observe(time.perf_counter() - started)
+        return reader, writer
+
+    def _release_upstream(self, reader, writer, reusable):
+        """Finish an attempt: pool the connection for its backend, or close it."""
+        backend = self._upstream_backends.pop(writer)
+        UPSTREAMS.done(backend)
+        idle = self._idle_upstream.setdefault(backend, [])
+        if reusable and len(idle) < self.max_idle_upstream and not writer.is_closing():
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    async def _send_error(self, writer, status, message, headers=()):
+        """Send an error page and close the connection; returns False."""
+        self._statuses[writer] = status
+        writer.write(error_page(status, message, headers))
+        await writer.drain()
+        return False
+
+async def copy_exact(reader, writer, length, timeout):
+    """Stream exactly length bytes; writer=None discards them."""
+    while length > 0:
+        data = await asyncio.wait_for(reader.read(min(length, STREAM_CHUNK)), timeout)
+        if not data:
+            raise asyncio.IncompleteReadError(b"", length)
+        if writer is not None:
+            writer.write(data)
+            await writer.drain()
+        length -= len(data)
+
+async def copy_chunked(reader, writer, timeout, dechunk=False):
+    """Stream a chunked body, passing the framing through unless dechunk is set."""
+    while True:
+        size_line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+        size = int(size_line.split(b";", 1)[0].strip(), 16)
+        if writer is not None and not dechunk:
+            writer.write(size_line)
+        if size == 0:
+            # Trailer section ends with an empty line
+            while True:
+                line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+                if writer is not None and not dechunk:
+                    writer.write(line)
+                if line == b"\r\n":
+                    break
+            if writer is not None:
+                await writer.drain()
+            return
+        await copy_exact(reader, writer, size, timeout)
+        crlf = await asyncio.wait_for(reader.readexactly(2), timeout)
+        if writer is not None and not dechunk:
+            writer.write(crlf)
+            await writer.drain()
+
+class ThreadingProxyServer(DrainingServerMixin, socketserver.ThreadingTCPServer):
+    """Thread-per-connection server with global and per-IP connection caps.
+
+    Connections over a cap are answered and closed from the accept loop,
+    so an abusive client can't make the proxy start more threads.
+    """
+
+    # Rebind immediately on restart instead of waiting out TIME_WAIT connections
+    allow_reuse_address = True
+
+    def __init__(self, server_address, RequestHandlerClass, max_connections=MAX_CONNECTIONS,
+                 backlog=BACKLOG, bind_and_activate=True):
+        self.request_queue_size = backlog
+        self._connection_slots = threading.BoundedSemaphore(max_connections)
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        if not self._connection_slots.acquire(blocking=False):
+            self.reject(request, 503, "overloaded", "Proxy is at capacity, try again shortly")
+            return
+        if not LIMITER.open_connection(client_address[0]):
+            self._connection_slots.release()
+            self.reject(request, 429, "per_ip", "Too many connections from your address")
+            return
+        try:
+            super().process_request(request, client_address)
+        except BaseException:
+            LIMITER.close_connection(client_address[0])
+            self._connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            LIMITER.close_connection(client_address[0])
+            self._connection_slots.release()
+
+    def reject(self, request, status, reason, message):
+        """Answer a refused connection without reading its request."""
+        REJECTED_CONNECTIONS.inc(reason)
+        try:
+            # A fresh socket's send buffer always has room for this
+            request.setblocking(False)
+            request.send(error_page(status, message,
+                                    [retry_after_header(OVERLOAD_RETRY_AFTER)]))
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+def create_proxy(engine, server_address, backlog=BACKLOG, max_connections=MAX_CONNECTIONS,
+                 listen_socket=None):
+    """Create a proxy server for the requested engine.
+
+    With listen_socket, the proxy takes over an already listening socket
+    instead of binding (SIGHUP restart).
+    """
+    if engine == "asyncio":
+        return AsyncTorCOINProxy(server_address, backlog=backlog,
+                                 max_connections=max_connections, listen_socket=listen_socket)
+    if listen_socket is None:
+        return ThreadingProxyServer(server_address, TorCOINProxyHandler,
+                                    max_connections=max_connections, backlog=backlog)
+    server = ThreadingProxyServer(server_address, TorCOINProxyHandler,
+                                  max_connections=max_connections, backlog=backlog,
+                                  bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_socket
+    server.server_address = listen_socket.getsockname()
+    return server
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="TorCOIN Self Proxy Server")
+    parser.add_argument("--engine", choices=PROXY_ENGINES, default=DEFAULT_ENGINE,
+                        help=f"proxy engine (default: {DEFAULT_ENGINE})")
+    parser.add_argument("--port", type=int, default=PROXY_PORT,
+                        help=f"port to listen on (default: {PROXY_PORT})")
+    parser.add_argument("--backlog", type=int, default=BACKLOG,
+                        help=f"listen backlog (default: {BACKLOG})")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT,
+                        help=f"requests/sec allowed per client IP, 0 disables (default: {RATE_LIMIT})")
+    parser.add_argument("--burst", type=int, default=RATE_BURST,
+                        help=f"request burst allowed per client IP (default: {RATE_BURST})")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help=f"concurrent client connections (default: {MAX_CONNECTIONS})")
+    parser.add_argument("--max-connections-per-ip", type=int, default=MAX_CONNECTIONS_PER_IP,
+                        help=f"concurrent connections per client IP, 0 disables "
+                             f"(default: {MAX_CONNECTIONS_PER_IP})")
+    parser.add_argument("--upstream", type=parse_backend, action="append", metavar="HOST:PORT",
+                        help=f"coin_server.py instance to balance across (repeatable; "
+                             f"default: {ALLOWED_HOST}:{ALLOWED_PORT})")
+    parser.add_argument("--balance", choices=BALANCE_STRATEGIES, default=DEFAULT_BALANCE,
+                        help=f"how requests are spread across upstreams (default: {DEFAULT_BALANCE})")
+    parser.add_argument("--health-interval", type=float, default=HEALTH_CHECK_INTERVAL,
+                        help=f"seconds between upstream health checks, 0 disables "
+                             f"(default: {HEALTH_CHECK_INTERVAL})")
+    add_lifecycle_arguments(parser)
+    add_logging_arguments(parser)
+    add_metrics_arguments(parser, METRICS_PORT)
+    return parser.parse_args(argv)
 
 def main():
     """Main proxy server function."""
-    PROXY_PORT = 8080  # Standard proxy port
+    args = parse_args()
+    PROXY_PORT = args.port
+    configure_from_args(ACCESS_LOG, args)
+    LIMITER.rate = args.rate
+    LIMITER.burst = args.burst
+    LIMITER.max_connections_per_ip = args.max_connections_per_ip
+    if args.upstream:
+        UPSTREAMS.backends = [Backend(host, port) for host, port in dict.fromkeys(args.upstream)]
+        POLICY.redirect_ports = frozenset(port for _, port in args.upstream) | {ALLOWED_PORT}
+    UPSTREAMS.strategy = args.balance
 
     print("=" * 60)
     print("         TORCOIN SELF PROXY SERVER")
     print("=" * 60)
     print(f"🛡️  STRICT MODE: Only allowing access to {ALLOWED_URL}")
     print(f"🌐 Proxy listening on port: {PROXY_PORT}")
+    print(f"⚙️  Engine: {args.engine}")
+    print(f"🔀 Upstreams ({args.balance}): "
+          f"{', '.join(backend.name for backend in UPSTREAMS.backends)}")
     print()
     print("🔒 SECURITY FEATURES:")
     print("✅ Blocks all traffic except TorCOIN server")
     print("✅ No external internet access through proxy")
     print("✅ Request/response filtering")
     print("✅ Timeout protection")
+    print(f"✅ Rate limiting ({args.rate:g} req/s per IP, burst {args.burst}, "
+          f"{args.max_connections} connections max)")
     print()
     print("📋 USAGE:")
     print(f"Set browser proxy to: localhost:{PROXY_PORT}")
     print("Then access: http://www.torcoin.cnet")
     print()
     print("🛑 Press Ctrl+C to stop the proxy")
+    if HANDOFF_SUPPORTED:
+        print("🔄 Send SIGHUP to restart without dropping connections")
     print("=" * 60)
 
+    # Serve on the socket handed over by a SIGHUP restart, if any
+    listen_socket = inherited_socket()
     try:
-        with socketserver.ThreadingTCPServer(("", PROXY_PORT), TorCOINProxyHandler) as httpd:
-            print(f"[✅] TorCOIN Proxy started on port {PROXY_PORT}")
+        with create_proxy(args.engine, ("", PROXY_PORT), backlog=args.backlog,
+                          max_connections=args.max_connections,
+                          listen_socket=listen_socket) as httpd:
+            httpd.drain_timeout = args.drain_timeout
+            if listen_socket is not None:
+                print(f"[✅] TorCOIN Proxy took over port {PROXY_PORT} (pid {os.getpid()})")
+            else:
+                print(f"[✅] TorCOIN Proxy started on port {PROXY_PORT}")
+            if args.metrics_port and listen_socket is not None:
+                # The process this one replaces holds the port until it has drained
+                start_metrics_server_after_handoff(METRICS, args.metrics_port,
+                                                   HANDOFF_TIMEOUT + args.drain_timeout,
+                                                   log=lambda message: print(f"[📊] {message}"))
+            elif args.metrics_port:
+                try:
+                    start_metrics_server(METRICS, args.metrics_port)
+                    print(f"[📊] Metrics at http://{METRICS_HOST}:{args.metrics_port}/metrics")
+                except OSError as e:
+                    print(f"[❌] Metrics endpoint disabled: {e}")
+            if args.health_interval > 0:
+                UPSTREAMS.start_health_checks(args.health_interval)
             print("[🛡️ ] STRICT MODE ACTIVE - Only TorCOIN traffic allowed!")
+            # SIGTERM/Ctrl+C and SIGHUP drain before serve_forever() returns
+            Lifecycle(httpd, log=lambda message: print(f"[🔄] {message}")).install()
+            notify_ready()
             httpd.serve_forever()
+        print("[🛑] Proxy stopped")
 
     except KeyboardInterrupt:
         print("\n[🛑] Proxy stopped by user")
@@ -5,7 +5,8 @@ A full-featured desktop wallet for TorCOIN with modern GUI.
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
+import bisect
 import json
 import os
 import hashlib
@@ -15,6 +16,696 @@ from datetime import datetime
 import threading
 import webbrowser
 
+try:
+    import sqlite3  # Optional: some minimal Python builds leave it out
+except ImportError:
+    sqlite3 = None
+
+# Wallet storage
+WALLET_FILE = "wallet.torwallet"  # Default wallet, loaded at startup
+JOURNAL_SUFFIX = ".journal"  # Transactions since the last snapshot, one JSON record per line
+JOURNAL_FSYNC_INTERVAL = 0.2  # Seconds appends are batched before one fsync
+JOURNAL_COMPACT_BYTES = 1024 * 1024  # Fold the journal into the snapshot at this size
+STORAGE_BACKENDS = ("journal", "sqlite") if sqlite3 is not None else ("journal",)
+SQLITE_HEADER = b"SQLite format 3\x00"  # First bytes of every SQLite database file
+
+# Transaction views
+TX_ROW_HEIGHT = 24  # Pixels per row in the history list
+RECENT_TRANSACTIONS = 3  # Rows in the dashboard preview
+FRAME_INTERVAL_MS = 16  # Wallet changes are applied to the views at most once per frame
+
+class WalletStore:
+    """Wallet file storage: a JSON snapshot plus an append-only journal.
+
+    The snapshot (the .torwallet file) holds the whole wallet as of the
+    last compaction; every change since then is one line in
+    <wallet>.journal. A send appends a single small record instead of
+    rewriting the whole history. Appends reach the OS at once and are
+    fsynced in batches, and once the journal reaches
+    JOURNAL_COMPACT_BYTES it is folded into a fresh snapshot.
+    """
+
+    backend = "journal"
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.data = None
+        self._seq = 0  # Sequence number of the last record written or replayed
+        self._journal = None
+        self._journal_size = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sync_thread = None
+
+    def load(self):
+        """Read the snapshot and replay the journal; returns the wallet dict or None."""
+        data, seq = None, 0
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            # Records up to here are already in the snapshot (compaction may
+            # have stopped before truncating the journal)
+            seq = data.pop("journal_seq", 0)
+
+        good_size = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn last write from a crash; drop it
+                    good_size += len(line)
+                    if record["seq"] <= seq:
+                        continue
+                    if data is None:
+                        data = {"transactions": []}
+                    data.update(record.get("set", {}))
+                    if "tx" in record:
+                        data["transactions"].append(record["tx"])
+                    seq = record["seq"]
+
+        self.data = data
+        self._seq = seq
+        self._open_journal(good_size)
+        return data
+
+    def append(self, data, tx=None, **fields):
+        """Journal new field values already applied to data, and/or add tx to its transactions.
+
+        tx is appended to data["transactions"] here, under the same lock as
+        the journal write and compaction, so a snapshot never holds a
+        transaction its journal record will add again. Returns tx's
+        position in the list (None without tx).
+        """
+        record = {"seq": 0}
+        if fields:
+            record["set"] = fields
+        position = None
+
+        with self._lock:
+            if tx is not None:
+                data["transactions"].append(tx)
+                position = len(data["transactions"]) - 1
+                record["tx"] = tx
+            if self._journal is None:
+                return position  # Closed while the app exits
+            self.data = data
+            self._seq += 1
+            record["seq"] = self._seq
+            line = (json.dumps(record, separators=(',', ':')) + "\n").encode('utf-8')
+            self._journal.write(line)
+            # Survives the app crashing; the fsync thread makes it survive power loss
+            self._journal.flush()
+            self._journal_size += len(line)
+            self._dirty = True
+            if self._journal_size >= JOURNAL_COMPACT_BYTES:
+                self._compact()
+        self._schedule_sync()
+        return position
+
+    def save_snapshot(self, data):
+        """Replace the stored wallet with data (new wallet, new address, opened file)."""
+        with self._lock:
+            self.data = data
+            self._compact()
+
+    def sync(self):
+        """fsync pending journal records now."""
+        with self._lock:
+            self._fsync()
+
+    def close(self):
+        """Flush everything to disk and close the journal."""
+        with self._lock:
+            if self._journal is None:
+                return
+            self._fsync()
+            self._journal.close()
+            self._journal = None
+        self._wake.set()
+
+    def _open_journal(self, size):
+        self._journal = open(self.journal_path, 'ab')
+        if self._journal.tell() != size:
+            # Cut off a torn record so new ones don't follow garbage
+            self._journal.truncate(size)
+            self._journal.seek(size)
+        self._journal_size = size
+
+    def _compact(self):
+        """Write data as the new snapshot, then empty the journal (lock held)."""
+        snapshot = dict(self.data, journal_seq=self._seq)
+        write_json_atomic(self.path, snapshot)
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        os.fsync(self._journal.fileno())
+        self._journal_size = 0
+        self._dirty = False
+
+    def _fsync(self):
+        if self._dirty and self._journal is not None:
+            os.fsync(self._journal.fileno())
+            self._dirty = False
+
+    def _schedule_sync(self):
+        if self._sync_thread is None:
+            self._sync_thread = threading.Thread(target=self._sync_loop, name="wallet-fsync",
+                                                 daemon=True)
+            self._sync_thread.start()
+        self._wake.set()
+
+    def _sync_loop(self):
+        while True:
+            self._wake.wait()
+            # Let more appends arrive so one fsync covers them all
+            time.sleep(JOURNAL_FSYNC_INTERVAL)
+            with self._lock:
+                self._wake.clear()
+                if self._journal is None:
+                    return
+                self._fsync()
+
+class SQLiteWalletStore:
+    """Wallet storage in an SQLite database (WAL mode), same interface as WalletStore.
+
+    Transactions are rows indexed on date, type, address and status, so
+    the history filters (query_positions()) stay fast at millions of rows;
+    a send is one small committed insert. A transaction's row id is its
+    position in the transaction list plus one.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS wallet (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL  -- JSON
+        );
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            type TEXT,
+            address TEXT,
+            status TEXT,
+            data TEXT NOT NULL  -- The transaction dict as JSON
+        );
+    """
+    INDEXES = {
+        "transactions_date": "transactions (date)",
+        "transactions_type": "transactions (type, date)",
+        "transactions_address": "transactions (address)",
+        "transactions_status": "transactions (status, date)",
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + "-wal"
+        self.data = None
+        self._db = None
+        # The UI and the balance thread share one connection
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Open the database; returns the wallet dict or None if it is empty."""
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only fsyncs at checkpoints: a power cut can lose the
+            # last few commits but never corrupts the database
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.SCHEMA)
+            self._create_indexes(db)
+            data = {key: json.loads(value)
+                    for key, value in db.execute("SELECT key, value FROM wallet")}
+            data["transactions"] = [json.loads(row[0]) for row in
+                                    db.execute("SELECT data FROM transactions ORDER BY id")]
+        except BaseException:
+            db.close()
+            raise
+        self._db = db
+        self.data = data if len(data) > 1 or data["transactions"] else None
+        return self.data
+
+    def append(self, data, tx=None, **fields):
+        """Store new field values already applied to data, and/or add tx to its transactions.
+
+        Like WalletStore.append(), tx is appended to the list here, under
+        the lock save_snapshot() holds, so its row id (position + 1) can't
+        already have been taken by a snapshot. Returns tx's position.
+        """
+        position = None
+        with self._lock:
+            if tx is not None:
+                data["transactions"].append(tx)
+                position = len(data["transactions"]) - 1
+            if self._db is None:
+                return position  # Closed while the app exits
+            self.data = data
+            with self._db:
+                if tx is not None:
+                    self._insert_transactions([tx], position)
+                self._set_fields(fields)
+        return position
+
+    def save_snapshot(self, data):
+        """Replace the stored wallet with data (new wallet, new address, opened file)."""
+        with self._lock:
+            self.data = data
+            with self._db:
+                # Building the indexes once after a bulk insert is many times
+                # faster than updating them row by row
+                for name in self.INDEXES:
+                    self._db.execute(f"DROP INDEX IF EXISTS {name}")
+                self._db.execute("DELETE FROM wallet")
+                self._db.execute("DELETE FROM transactions")
+                self._set_fields({key: value for key, value in data.items()
+                                  if key != "transactions"})
+                self._insert_transactions(data["transactions"])
+                self._create_indexes(self._db)
+
+    def query_positions(self, tx_type=None, status=None, address_prefix=None,
+                        date_from=None, date_to=None):
+        """Return list positions of the stored transactions that match, oldest first.
+
+        Same result as TransactionIndex.query(), but answered from the
+        database indexes. Dates compare as the stored "YYYY-MM-DD HH:MM:SS"
+        strings; date_to is inclusive.
+        """
+        where, params = self._filters(tx_type, status, address_prefix, date_from, date_to)
+        with self._lock:
+            if not where:
+                return range(self._db.execute("SELECT COUNT(*) FROM transactions").fetchone()[0])
+            return [row[0] for row in self._db.execute(
+                f"SELECT id - 1 FROM transactions{where} ORDER BY id", params)]
+
+    def sync(self):
+        """Checkpoint the WAL into the database file."""
+        with self._lock:
+            if self._db is not None:
+                self._db.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def close(self):
+        """Checkpoint and close the database."""
+        with self._lock:
+            if self._db is None:
+                return
+            self._db.close()
+            self._db = None
+
+    def _create_indexes(self, db):
+        for name, columns in self.INDEXES.items():
+            db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+
+    def _set_fields(self, fields):
+        self._db.executemany("INSERT OR REPLACE INTO wallet (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in fields.items()])
+
+    def _insert_transactions(self, transactions, first_position=0):
+        self._db.executemany(
+            "INSERT INTO transactions (id, date, type, address, status, data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(first_position + offset + 1, tx.get("date"), tx.get("type"), tx.get("address"),
+              tx.get("status"), json.dumps(tx, separators=(',', ':')))
+             for offset, tx in enumerate(transactions)])
+
+    @staticmethod
+    def _filters(tx_type, status, address_prefix, date_from, date_to):
+        clauses, params = [], []
+        if tx_type is not None:
+            clauses.append("type = ?")
+            params.append(tx_type)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if address_prefix:
+            # A range instead of LIKE, so the address index is used
+            clauses.append("address >= ? AND address < ?")
+            params += [address_prefix, address_prefix + "\U0010ffff"]
+        if date_from is not None:
+            clauses.append("date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            clauses.append("date <= ?")
+            params.append(date_to)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def is_sqlite_wallet(path):
+    """Whether the wallet file at path is an SQLite database rather than JSON."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+def wallet_damaged(path, error):
+    """Whether a load error means the wallet file is corrupt, not just unavailable right now.
+
+    A locked database, a missing sqlite3 module or an I/O error says
+    nothing about the file itself.
+    """
+    if isinstance(error, (json.JSONDecodeError, UnicodeDecodeError)):
+        return True
+    if sqlite3 is None or not isinstance(error, sqlite3.DatabaseError):
+        return False
+    try:
+        db = sqlite3.connect(path)
+        try:
+            return db.execute("PRAGMA integrity_check").fetchone()[0] != "ok"
+        finally:
+            db.close()
+    except sqlite3.OperationalError:
+        return False  # Busy or locked
+    except sqlite3.DatabaseError:
+        return True  # Not a database at all, or damaged beyond checking
+
+def open_wallet_store(path):
+    """Return an unloaded store for the wallet file at path, matching its format."""
+    if is_sqlite_wallet(path):
+        if sqlite3 is None:
+            raise RuntimeError("This wallet uses SQLite storage, but this Python has no sqlite3 module")
+        return SQLiteWalletStore(path)
+    return WalletStore(path)
+
+def convert_wallet_store(store, data, backend):
+    """Rewrite the wallet at store.path with the given backend; returns the new, loaded store.
+
+    Moving from JSON to SQLite keeps a full JSON copy as <wallet>.json.bak.
+    """
+    path = store.path
+    store.close()
+    if backend == "sqlite":
+        export_wallet(path + ".json.bak", data)
+        temp_path = path + ".converting"
+        for leftover in (temp_path, temp_path + "-wal", temp_path + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        converted = SQLiteWalletStore(temp_path)
+        converted.load()
+        converted.save_snapshot(data)
+        converted.close()
+        os.replace(temp_path, path)
+        if os.path.exists(path + JOURNAL_SUFFIX):
+            os.remove(path + JOURNAL_SUFFIX)
+    else:
+        export_wallet(path, data)
+
+    store = open_wallet_store(path)
+    store.load()
+    return store
+
+def export_wallet(path, data):
+    """Write data as a self-contained wallet file (Save As, backups)."""
+    write_json_atomic(path, data)
+    # A journal left next to the target belongs to whatever wallet was there before
+    if os.path.exists(path + JOURNAL_SUFFIX):
+        os.remove(path + JOURNAL_SUFFIX)
+
+def write_json_atomic(path, data):
+    """Write data as compact JSON to path so a crash leaves the old or the new file, never half of one."""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Make the rename itself durable (POSIX only)
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class TransactionIndex:
+    """Lookup structures over the transaction list for the history filters.
+
+    Positions are kept per type, sorted by date and sorted by address,
+    and updated as transactions are appended, so a filter costs time in
+    proportion to its smallest matching set rather than the history. The
+    date and address orders are only built the first time they are used.
+    """
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self._by_type = {}  # type -> positions, ascending
+        self._sorted = {}  # field -> (sorted values, positions in the same order)
+        self._lock = threading.Lock()
+        for position, tx in enumerate(transactions):
+            self._by_type.setdefault(tx.get("type"), []).append(position)
+
+    def add(self, tx, position):
+        """Index a transaction the wallet store has appended to the list at position."""
+        with self._lock:
+            # Two threads' adds can arrive out of order; keep the positions ascending
+            bisect.insort(self._by_type.setdefault(tx.get("type"), []), position)
+            for field, (values, positions) in self._sorted.items():
+                value = tx.get(field, "")
+                # New transactions are normally the newest, so dates land at the end
+                index = bisect.bisect_right(values, value)
+                values.insert(index, value)
+                positions.insert(index, position)
+
+    def count(self, tx_type=None):
+        """Number of transactions, optionally of one type."""
+        if tx_type is None:
+            return len(self.transactions)
+        return len(self._by_type.get(tx_type, ()))
+
+    def query(self, tx_type=None, address_prefix=None, date_from=None, date_to=None):
+        """Return positions of matching transactions, oldest first.
+
+        Dates compare as "YYYY-MM-DD HH:MM:SS" strings, so "2025-03-01"
+        works as a lower bound; date_to is inclusive.
+        """
+        with self._lock:
+            # Each filter gives a candidate set whose size is known without building it
+            candidates = []
+            if tx_type is not None:
+                positions = self._by_type.get(tx_type, [])
+                candidates.append((len(positions), 0, len(positions), positions))
+            if date_from is not None or date_to is not None:
+                values, positions = self._sorted_by("date")
+                low = 0 if date_from is None else bisect.bisect_left(values, date_from)
+                high = len(values) if date_to is None else bisect.bisect_right(values, date_to)
+                candidates.append((max(0, high - low), low, high, positions))
+            if address_prefix:
+                values, positions = self._sorted_by("address")
+                low = bisect.bisect_left(values, address_prefix)
+                high = bisect.bisect_left(values, address_prefix + "\U0010ffff")
+                candidates.append((high - low, low, high, positions))
+
+            if not candidates:
+                # Indexable like a list, without building a million-entry one
+                return range(len(self.transactions))
+            # Take the smallest set and check the other filters on its members only
+            _, low, high, positions = min(candidates, key=lambda candidate: candidate[0])
+            positions = positions[low:high]
+            if len(candidates) > 1:
+                transactions = self.transactions
+                positions = [p for p in positions
+                             if self.matches(transactions[p], tx_type, address_prefix,
+                                             date_from, date_to)]
+            positions.sort()
+            return positions
+
+    def _sorted_by(self, field):
+        """(sorted values, positions) for field, built on first use (lock held)."""
+        if field not in self._sorted:
+            # Only indexed positions: the store may have appended one add() hasn't seen yet
+            indexed = sorted(position for positions in self._by_type.values()
+                             for position in positions)
+            transactions = self.transactions
+            # Dates are usually appended in order already, which sorts in linear time
+            positions = sorted(indexed, key=lambda position: transactions[position].get(field, ""))
+            self._sorted[field] = ([transactions[p].get(field, "") for p in positions], positions)
+        return self._sorted[field]
+
+    @staticmethod
+    def matches(tx, tx_type=None, address_prefix=None, date_from=None, date_to=None):
+        """Whether tx passes the filters query() takes."""
+        date = tx.get("date", "")
+        return ((tx_type is None or tx.get("type") == tx_type)
+                and (not address_prefix or tx.get("address", "").startswith(address_prefix))
+                and (date_from is None or date >= date_from)
+                and (date_to is None or date <= date_to))
+
+class VirtualTransactionList:
+    """Transaction history in a ttk.Treeview that only holds the rows on screen.
+
+    The Treeview never scrolls itself: it has one item per visible row,
+    and scrolling (scrollbar, wheel, keys) moves an offset into the
+    result and refills those items from fetch(index). Rendering cost is
+    bounded by the window height, not the history size.
+    """
+
+    COLUMNS = (("date", "Date", 150), ("type", "Type", 90), ("amount", "Amount", 130),
+               ("address", "Address", 360), ("status", "Status", 90))
+
+    def __init__(self, parent, colors):
+        self.frame = tk.Frame(parent, bg=colors['bg_tertiary'])
+        style = ttk.Style()
+        style.configure('Transactions.Treeview', rowheight=TX_ROW_HEIGHT,
+                        background=colors['bg_tertiary'], fieldbackground=colors['bg_tertiary'],
+                        foreground=colors['text_primary'], font=('Consolas', 10))
+        self.tree = ttk.Treeview(self.frame, columns=[name for name, _, _ in self.COLUMNS],
+                                 show="headings", selectmode="browse", height=1,
+                                 style='Transactions.Treeview')
+        for name, heading, width in self.COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, anchor=tk.W, stretch=(name == "address"))
+        self.tree.tag_configure("received", foreground=colors['success'])
+        self.tree.tag_configure("sent", foreground=colors['error'])
+
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.count = 0
+        self.fetch = None
+        self.offset = 0
+        self.visible = 1
+        self._items = []  # Treeview item ids, one per visible row, reused
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))  # X11 wheel
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        for key, rows in (("<Up>", -1), ("<Down>", 1)):
+            self.tree.bind(key, lambda event, rows=rows: self.scroll(rows) or "break")
+        for key, pages in (("<Prior>", -1), ("<Next>", 1)):
+            self.tree.bind(key, lambda event, pages=pages: self.scroll(pages * self.visible) or "break")
+        self.tree.bind("<Home>", lambda event: self.scroll_to(0) or "break")
+        self.tree.bind("<End>", lambda event: self.scroll_to(self.count) or "break")
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def set_rows(self, count, fetch, keep_position=True):
+        """Show count rows, row i being the transaction fetch(i) returns."""
+        self.count = count
+        self.fetch = fetch
+        self.scroll_to(self.offset if keep_position else 0)
+
+    def rows_added(self, count, rows):
+        """count rows were inserted at the top; only the visible rows are redrawn."""
+        self.count = count
+        # Keep showing the same transactions unless the top of the list is in view
+        if self.offset:
+            self.offset += rows
+        self.scroll_to(self.offset)
+
+    def scroll(self, rows):
+        self.scroll_to(self.offset + rows)
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, self.count - self.visible))
+        self._render()
+
+    def _render(self):
+        # Match the item count to the rows that fit, then refill them in place
+        while len(self._items) < self.visible:
+            self._items.append(self.tree.insert("", tk.END))
+        while len(self._items) > self.visible:
+            self.tree.delete(self._items.pop())
+
+        for slot, item in enumerate(self._items):
+            index = self.offset + slot
+            if index < self.count:
+                tx = self.fetch(index)
+                self.tree.item(item, tags=(tx['type'],), values=(
+                    tx['date'], tx['type'].title(), f"{tx['amount']:.2f} TOR",
+                    tx['address'], tx['status']))
+            else:
+                self.tree.item(item, tags=(), values=())
+
+        if self.count:
+            self.scrollbar.set(self.offset / self.count,
+                               min(1.0, (self.offset + self.visible) / self.count))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_resize(self, event):
+        # One row's worth of the height goes to the column headings
+        visible = max(1, event.height // TX_ROW_HEIGHT - 1)
+        if visible != self.visible:
+            self.visible = visible
+            self.scroll_to(self.offset)
+
+    def _on_wheel(self, event):
+        self.scroll(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.count))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self.scroll(int(amount) * step)
+
+class WalletChanges:
+    """What changed in the wallet since the views were last updated."""
+
+    def __init__(self):
+        self.balance = False
+        self.address = False
+        self.reset = False  # Whole wallet replaced (new, opened, new address): redraw everything
+        self.transactions = []  # Positions of appended transactions, oldest first
+
+    def __bool__(self):
+        return self.balance or self.address or self.reset or bool(self.transactions)
+
+class WalletEvents:
+    """Typed change events from any thread, delivered to the views once per frame.
+
+    Events arriving within FRAME_INTERVAL_MS of each other (a burst of
+    received transactions, a send that also changes the balance) are
+    merged into one WalletChanges, so the views redraw once. Emitting only
+    records the change; Tk is only ever called from the Tk thread, which
+    polls for pending changes every frame.
+    """
+
+    def __init__(self, root, interval_ms=FRAME_INTERVAL_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._listeners = []
+        self._pending = WalletChanges()
+        self._lock = threading.Lock()
+        # Must be created on the Tk thread
+        self.root.after(self.interval_ms, self._poll)
+
+    def subscribe(self, listener):
+        """Call listener(changes) on the Tk thread for every batch of changes."""
+        self._listeners.append(listener)
+
+    def balance_changed(self):
+        with self._lock:
+            self._pending.balance = True
+
+    def address_changed(self):
+        with self._lock:
+            self._pending.address = True
+
+    def transaction_added(self, position):
+        with self._lock:
+            self._pending.transactions.append(position)
+
+    def wallet_replaced(self):
+        with self._lock:
+            self._pending.reset = True
+
+    def _poll(self):
+        with self._lock:
+            changes, self._pending = self._pending, WalletChanges()
+        try:
+            if changes:
+                for listener in self._listeners:
+                    listener(changes)
+        finally:
+            self.root.after(self.interval_ms, self._poll)
+
 class TorCOINWallet:
     def __init__(self, root):
         self.root = root
@@ -28,11 +719,20 @@ class TorCOINWallet:
             "settings": {
                 "theme": "dark",
                 "auto_backup": True,
-                "notifications": True
+                "notifications": True,
+                "storage": "journal"
             }
         }
 
+        # Views are updated from these events, see apply_changes
+        self.events = WalletEvents(root)
+
         # Load wallet if exists
+        self.store = None
+        self.tx_index = None
+        # Active history filters (see filter_transactions)
+        self.tx_filter = {"tx_type": None, "address_prefix": None,
+                          "date_from": None, "date_to": None}
         self.load_wallet()
 
         # Create GUI styles first
@@ -48,6 +748,7 @@ class TorCOINWallet:
         self.create_menu()
         self.create_status_bar()
         self.create_main_interface()
+        self.events.subscribe(self.apply_changes)
 
         # Apply theme
         self.apply_theme()
@@ -240,7 +941,7 @@ class TorCOINWallet:
                                  style='Header.TLabel', background=self.colors['bg_panel'])
         balance_title.pack(pady=(25, 15))
 
-        self.balance_label = ttk.Label(balance_frame, text=".2f",
+        self.balance_label = ttk.Label(balance_frame, text=f"{self.wallet_data['balance']:.2f} TOR",
                                       style='Balance.TLabel', background=self.colors['bg_panel'])
         self.balance_label.pack(pady=(0, 25))
 
@@ -496,12 +1197,30 @@ class TorCOINWallet:
         ttk.Button(filter_frame, text="Received", style='Primary.TButton',
                   command=lambda: self.filter_transactions("received")).pack(side=tk.LEFT)
 
-        # Transactions display
-        self.transactions_text = scrolledtext.ScrolledText(list_frame, wrap=tk.WORD,
-                                                         font=('Consolas', 10),
-                                                         bg=self.colors['bg_tertiary'],
-                                                         fg=self.colors['text_primary'])
-        self.transactions_text.pack(fill=tk.BOTH, expand=True, padx=20, pady=(10, 20))
+        # Date range (YYYY-MM-DD) and address prefix; Enter applies them
+        range_frame = tk.Frame(list_frame, bg=self.colors['bg_secondary'])
+        range_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(range_frame, text="From:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_from_entry = ttk.Entry(range_frame, width=12)
+        self.filter_from_entry.pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(range_frame, text="To:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_to_entry = ttk.Entry(range_frame, width=12)
+        self.filter_to_entry.pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Label(range_frame, text="Address starts with:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_address_entry = ttk.Entry(range_frame, width=24)
+        self.filter_address_entry.pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(range_frame, text="Apply", style='Primary.TButton',
+                  command=lambda: self.filter_transactions(None)).pack(side=tk.LEFT)
+        for entry in (self.filter_from_entry, self.filter_to_entry, self.filter_address_entry):
+            entry.bind("<Return>", lambda event: self.filter_transactions(None))
+
+        self.filter_status_label = ttk.Label(list_frame, text="", style='Primary.TLabel')
+        self.filter_status_label.pack(anchor=tk.W, padx=20)
+
+        # Transactions display: only the rows on screen exist as Treeview items
+        self.transactions_list = VirtualTransactionList(list_frame, self.colors)
+        self.transactions_list.pack(fill=tk.BOTH, expand=True, padx=20, pady=(10, 20))
 
         self.update_transactions_display()
 
@@ -552,7 +1271,15 @@ class TorCOINWallet:
 
         self.notifications_var = tk.BooleanVar(value=self.wallet_data["settings"]["notifications"])
         ttk.Checkbutton(privacy_frame, text="Enable transaction notifications",
-                       variable=self.notifications_var).pack(anchor=tk.W)
+                       variable=self.notifications_var).pack(anchor=tk.W, pady=(0, 10))
+
+        storage_frame = tk.Frame(privacy_frame, bg=self.colors['bg_tertiary'])
+        storage_frame.pack(fill=tk.X)
+
+        ttk.Label(storage_frame, text="Wallet storage:").pack(side=tk.LEFT, padx=(0, 20))
+        self.storage_var = tk.StringVar(value=self.store.backend)
+        ttk.Combobox(storage_frame, textvariable=self.storage_var,
+                    values=STORAGE_BACKENDS, state="readonly", width=10).pack(side=tk.LEFT)
 
         # Network settings
         network_frame = tk.Frame(settings_frame, bg=self.colors['bg_tertiary'])
@@ -613,12 +1340,19 @@ class TorCOINWallet:
         if messagebox.askyesno("Create New Wallet",
                              "This will create a new wallet. Any existing wallet data will be lost. Continue?"):
             self.generate_wallet()
-            self.save_wallet()
-            self.update_display()
+            self.store.save_snapshot(self.wallet_data)
+            self.events.wallet_replaced()
             messagebox.showinfo("Success", "New wallet created successfully!")
 
     def generate_wallet(self):
         """Generate a new wallet with address and keys."""
+        self.generate_address()
+        self.wallet_data["balance"] = 0.0
+        self.wallet_data["transactions"] = []
+        self.tx_index = TransactionIndex(self.wallet_data["transactions"])
+
+    def generate_address(self):
+        """Give the wallet a new address and private key; balance and history stay."""
         # Generate a random private key (simplified for demo)
         private_key = secrets.token_hex(32)
 
@@ -628,8 +1362,6 @@ class TorCOINWallet:
 
         self.wallet_data["private_key"] = private_key
         self.wallet_data["address"] = address
-        self.wallet_data["balance"] = 0.0
-        self.wallet_data["transactions"] = []
 
     def open_wallet(self):
         """Open an existing wallet file."""
@@ -639,9 +1371,16 @@ class TorCOINWallet:
         )
         if filename:
             try:
-                with open(filename, 'r') as f:
-                    self.wallet_data = json.load(f)
-                self.update_display()
+                store = open_wallet_store(filename)
+                data = store.load()
+                if data is None:
+                    raise ValueError("empty wallet file")
+                # The opened wallet becomes the one sends are journaled to
+                self.store.close()
+                self.store = store
+                self.wallet_data = data
+                self.tx_index = TransactionIndex(data["transactions"])
+                self.events.wallet_replaced()
                 messagebox.showinfo("Success", "Wallet opened successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to open wallet: {e}")
@@ -659,8 +1398,10 @@ class TorCOINWallet:
         )
         if filename:
             try:
-                with open(filename, 'w') as f:
-                    json.dump(self.wallet_data, f, indent=4)
+                if os.path.abspath(filename) == os.path.abspath(self.store.path):
+                    self.store.save_snapshot(self.wallet_data)
+                else:
+                    export_wallet(filename, self.wallet_data)
                 messagebox.showinfo("Success", "Wallet saved successfully!")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save wallet: {e}")
@@ -676,32 +1417,71 @@ class TorCOINWallet:
         backup_filename = f"torcoin_wallet_backup_{timestamp}.torwallet"
 
         try:
-            with open(backup_filename, 'w') as f:
-                json.dump(self.wallet_data, f, indent=4)
+            export_wallet(backup_filename, self.wallet_data)
             messagebox.showinfo("Success", f"Wallet backed up as:\n{backup_filename}")
         except Exception as e:
             messagebox.showerror("Error", f"Backup failed: {e}")
 
     def load_wallet(self):
-        """Load wallet from default location if it exists."""
-        if os.path.exists("wallet.torwallet"):
-            try:
-                with open("wallet.torwallet", 'r') as f:
-                    self.wallet_data = json.load(f)
-            except:
-                # If loading fails, generate new wallet
-                self.generate_wallet()
-
-        if not self.wallet_data["address"]:
+        """Load wallet from default location (snapshot plus journal) if it exists."""
+        try:
+            self.store = open_wallet_store(WALLET_FILE)
+            data = self.store.load()
+        except Exception as e:
+            if not wallet_damaged(WALLET_FILE, e):
+                # The file may well be fine (e.g. locked by another open wallet);
+                # starting a new wallet would overwrite it
+                messagebox.showerror("Error", f"Failed to load wallet: {e}")
+                self.root.destroy()
+                raise SystemExit(1)
+            # Set the corrupt files aside rather than overwrite them, and start fresh.
+            # SQLite's -wal/-shm follow the database so it can still be opened.
+            quarantine = WALLET_FILE + ".unreadable"
+            for path, target in ((WALLET_FILE, quarantine),
+                                 (WALLET_FILE + "-wal", quarantine + "-wal"),
+                                 (WALLET_FILE + "-shm", quarantine + "-shm"),
+                                 (WALLET_FILE + JOURNAL_SUFFIX, quarantine + JOURNAL_SUFFIX)):
+                if os.path.exists(path):
+                    os.replace(path, target)
+            self.store = WalletStore(WALLET_FILE)
+            data = self.store.load()
+        if data is not None:
+            self.wallet_data = data
+        self.tx_index = TransactionIndex(self.wallet_data["transactions"])
+
+        if not self.wallet_data.get("address"):
             self.generate_wallet()
+            self.store.save_snapshot(self.wallet_data)
+
+        # Wallets switched to SQLite on another install are migrated on first load
+        storage = self.wallet_data["settings"].get("storage", "journal")
+        if storage != self.store.backend and storage in STORAGE_BACKENDS:
+            self.store = convert_wallet_store(self.store, self.wallet_data, storage)
+
+    def apply_changes(self, changes):
+        """Bring the views up to date with one frame's worth of WalletChanges."""
+        if changes.reset:
+            self.update_display()
+            return
+        if changes.balance:
+            self.update_balance_display()
+        if changes.address:
+            self.update_address_display()
+        if changes.transactions:
+            self.update_recent_transactions()
+            self.append_transactions_display(changes.transactions)
 
     def update_display(self):
         """Update all display elements with current wallet data."""
-        self.balance_label.config(text=".2f")
+        self.update_balance_display()
         self.update_address_display()
         self.update_recent_transactions()
         self.update_transactions_display()
 
+    def update_balance_display(self):
+        """Update the dashboard balance."""
+        self.balance_label.config(text=f"{self.wallet_data['balance']:.2f} TOR")
+
     def update_address_display(self):
         """Update the address display in receive frame."""
         if hasattr(self, 'address_label'):
@@ -713,47 +1493,97 @@ class TorCOINWallet:
     def update_recent_transactions(self):
         """Update the recent transactions preview."""
         if hasattr(self, 'recent_transactions_frame'):
-            # Clear existing
-            for widget in self.recent_transactions_frame.winfo_children():
-                widget.destroy()
-
-            # Show last 3 transactions
-            recent_txs = self.wallet_data["transactions"][-3:]
+            if not hasattr(self, 'recent_rows'):
+                self.create_recent_rows()
 
-            if not recent_txs:
-                ttk.Label(self.recent_transactions_frame,
-                         text="No transactions yet",
-                         style='Primary.TLabel').pack(pady=20)
+            # Refill the fixed rows in place instead of rebuilding widgets
+            recent_txs = self.wallet_data["transactions"][-RECENT_TRANSACTIONS:][::-1]
+            if recent_txs:
+                self.recent_empty_label.pack_forget()
             else:
-                for tx in reversed(recent_txs):
-                    tx_frame = tk.Frame(self.recent_transactions_frame, bg=self.colors['bg_tertiary'])
-                    tx_frame.pack(fill=tk.X, pady=2)
-
-                    amount_color = self.colors['success'] if tx['type'] == 'received' else self.colors['error']
-                    amount_prefix = "+" if tx['type'] == 'received' else "-"
-
-                    ttk.Label(tx_frame, text=".2f",
-                             foreground=amount_color, font=('Segoe UI', 10, 'bold')).pack(side=tk.LEFT, padx=10)
-                    ttk.Label(tx_frame, text=f"{tx['type'].title()} • {tx['date']}",
-                             style='Primary.TLabel').pack(side=tk.RIGHT, padx=10)
-
-    def update_transactions_display(self):
-        """Update the full transactions display."""
-        if hasattr(self, 'transactions_text'):
-            self.transactions_text.delete(1.0, tk.END)
-
-            if not self.wallet_data["transactions"]:
-                self.transactions_text.insert(tk.END, "No transactions found.\n\nSend or receive TorCOIN to see transactions here.")
+                self.recent_empty_label.pack(pady=20)
+            for slot, (tx_frame, amount_label, info_label) in enumerate(self.recent_rows):
+                if slot >= len(recent_txs):
+                    tx_frame.pack_forget()
+                    continue
+                tx = recent_txs[slot]
+                amount_color = self.colors['success'] if tx['type'] == 'received' else self.colors['error']
+                amount_prefix = "+" if tx['type'] == 'received' else "-"
+                amount_label.config(text=f"{amount_prefix}{tx['amount']:.2f} TOR",
+                                    foreground=amount_color)
+                info_label.config(text=f"{tx['type'].title()} • {tx['date']}")
+                tx_frame.pack(fill=tk.X, pady=2)
+
+    def create_recent_rows(self):
+        """Build the dashboard preview rows once; update_recent_transactions refills them."""
+        self.recent_empty_label = ttk.Label(self.recent_transactions_frame,
+                                            text="No transactions yet",
+                                            style='Primary.TLabel')
+        self.recent_rows = []
+        for _ in range(RECENT_TRANSACTIONS):
+            tx_frame = tk.Frame(self.recent_transactions_frame, bg=self.colors['bg_tertiary'])
+            amount_label = ttk.Label(tx_frame, font=('Segoe UI', 10, 'bold'))
+            amount_label.pack(side=tk.LEFT, padx=10)
+            info_label = ttk.Label(tx_frame, style='Primary.TLabel')
+            info_label.pack(side=tk.RIGHT, padx=10)
+            self.recent_rows.append((tx_frame, amount_label, info_label))
+
+    def update_transactions_display(self, keep_position=True):
+        """Update the transaction history with the transactions matching the filters."""
+        if hasattr(self, 'transactions_list'):
+            transactions = self.wallet_data["transactions"]
+            # Oldest first, so new matches are appended; the list shows them newest first
+            if self.store.backend == "sqlite":
+                # The database indexes answer the filters; no in-memory ones are built
+                self.tx_view_positions = self.store.query_positions(**self.tx_filter)
             else:
-                for tx in reversed(self.wallet_data["transactions"]):
-                    self.transactions_text.insert(tk.END,
-                        f"Date: {tx['date']}\n"
-                        f"Type: {tx['type'].title()}\n"
-                        f"Amount: {tx['amount']:.2f} TOR\n"
-                        f"Address: {tx['address'][:20]}...\n"
-                        f"Status: {tx['status']}\n"
-                        f"{'─' * 50}\n\n"
-                    )
+                self.tx_view_positions = self.tx_index.query(**self.tx_filter)
+            self.update_transactions_status()
+
+            self.transactions_list.set_rows(
+                len(self.tx_view_positions),
+                # Rows are looked up only when they scroll into view
+                lambda index: transactions[self.tx_view_positions[-1 - index]],
+                keep_position)
+
+    def append_transactions_display(self, new_positions):
+        """Add newly appended transactions to the history without rebuilding it."""
+        if not hasattr(self, 'transactions_list'):
+            return
+        transactions = self.wallet_data["transactions"]
+        added = 0
+        for position in new_positions:
+            if position >= len(transactions):
+                continue  # From a replaced wallet
+            positions = self.tx_view_positions
+            if isinstance(positions, range):
+                # Unfiltered: still every position from 0
+                if position >= len(positions):
+                    self.tx_view_positions = range(position + 1)
+                    added += position + 1 - len(positions)
+                continue
+            # Skip what a full rebuild after the event already picked up
+            index = bisect.bisect_left(positions, position)
+            if index < len(positions) and positions[index] == position:
+                continue
+            if self.tx_index.matches(transactions[position], **self.tx_filter):
+                positions.insert(index, position)
+                added += 1
+        self.update_transactions_status()
+        if added:
+            self.transactions_list.rows_added(len(self.tx_view_positions), added)
+
+    def update_transactions_status(self):
+        """Update the "Showing N of M" line above the history."""
+        total = len(self.wallet_data["transactions"])
+        shown = len(self.tx_view_positions)
+        if not total:
+            status = "No transactions yet. Send or receive TorCOIN to see transactions here."
+        elif not shown:
+            status = "No transactions match the current filter."
+        else:
+            status = f"Showing {shown} of {total} transactions"
+        self.filter_status_label.config(text=status)
 
     def send_transaction(self):
         """Send a TorCOIN transaction."""
@@ -800,11 +1630,9 @@ class TorCOINWallet:
             "status": "confirmed"
         }
 
-        self.wallet_data["transactions"].append(transaction)
         self.wallet_data["balance"] -= total_cost
-
-        self.update_display()
-        self.save_wallet()
+        self.add_transaction(transaction, balance=self.wallet_data["balance"])
+        self.events.balance_changed()
 
         # Clear form
         self.send_address_entry.delete(1.0, tk.END)
@@ -834,8 +1662,10 @@ class TorCOINWallet:
         """Generate a new wallet address."""
         if messagebox.askyesno("Generate New Address",
                              "This will create a new address. Your old address will still work. Continue?"):
-            self.generate_wallet()
-            self.update_display()
+            self.generate_address()
+            self.store.append(self.wallet_data, address=self.wallet_data["address"],
+                              private_key=self.wallet_data["private_key"])
+            self.events.address_changed()
             messagebox.showinfo("Success", "New address generated!")
 
     def generate_payment_link(self):
@@ -856,17 +1686,56 @@ class TorCOINWallet:
         self.root.clipboard_append(link)
         messagebox.showinfo("Success", f"Payment link copied:\n\n{link}")
 
+    def add_transaction(self, transaction, **fields):
+        """Append a transaction to the history, store it with any changed fields, tell the views.
+
+        The event goes out only once the transaction is stored, so a
+        history read back from the SQLite store never misses it.
+        """
+        # The store appends it to the list, under the lock its snapshots are taken with
+        position = self.store.append(self.wallet_data, tx=transaction, **fields)
+        self.tx_index.add(transaction, position)
+        self.events.transaction_added(position)
+
     def filter_transactions(self, filter_type):
-        """Filter transactions by type."""
-        # This would implement filtering logic
-        messagebox.showinfo("Info", f"Filtering by: {filter_type}")
+        """Filter transactions by type ("all", "sent" or "received") and the date/address fields."""
+        date_from = self.filter_from_entry.get().strip()
+        date_to = self.filter_to_entry.get().strip()
+        address_prefix = self.filter_address_entry.get().strip()
+        for label, value in (("From", date_from), ("To", date_to)):
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    messagebox.showerror("Error", f"{label} date must look like 2025-01-31.")
+                    return
+
+        if filter_type is not None:
+            self.tx_filter["tx_type"] = None if filter_type == "all" else filter_type
+        self.tx_filter["date_from"] = date_from or None
+        # Inclusive: the whole "to" day
+        self.tx_filter["date_to"] = f"{date_to} 23:59:59" if date_to else None
+        self.tx_filter["address_prefix"] = address_prefix or None
+        self.update_transactions_display(keep_position=False)
 
     def save_settings(self):
         """Save the current settings."""
         self.wallet_data["settings"]["theme"] = self.theme_var.get()
         self.wallet_data["settings"]["auto_backup"] = self.auto_backup_var.get()
         self.wallet_data["settings"]["notifications"] = self.notifications_var.get()
-        self.save_wallet()
+        self.wallet_data["settings"]["storage"] = self.storage_var.get()
+        if self.storage_var.get() != self.store.backend:
+            try:
+                self.store = convert_wallet_store(self.store, self.wallet_data, self.storage_var.get())
+            except Exception as e:
+                # The wallet file is untouched until the converted one replaces it; go back to it
+                self.wallet_data["settings"]["storage"] = self.store.backend
+                self.store = open_wallet_store(self.store.path)
+                self.store.load()
+                messagebox.showerror("Error", f"Failed to convert wallet storage: {e}")
+                return
+        else:
+            self.store.append(self.wallet_data, settings=self.wallet_data["settings"])
         messagebox.showinfo("Success", "Settings saved!")
 
     def start_balance_updates(self):
@@ -885,8 +1754,9 @@ class TorCOINWallet:
                         "address": "TOR" + secrets.token_hex(20).upper(),
                         "status": "confirmed"
                     }
-                    self.wallet_data["transactions"].append(transaction)
-                    self.update_display()
+                    self.add_transaction(transaction, balance=self.wallet_data["balance"])
+                    # Views update on the Tk thread, in the next frame
+                    self.events.balance_changed()
 
         thread = threading.Thread(target=update_balance, daemon=True)
         thread.start()
@@ -990,8 +1860,8 @@ Privacy Through Innovation
 
     def on_closing(self):
         """Handle application closing."""
-        if messagebox.askyesno("Quit", "Do you want to save your wallet before quitting?"):
-            self.save_wallet()
+        # Every change is already journaled; just flush the last batch to disk
+        self.store.close()
         self.root.quit()
 
 def main():